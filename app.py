@@ -1,17 +1,21 @@
 import streamlit as st
 import pandas as pd
-import json
-import hashlib
-import datetime
 from datetime import date
-import base64
-from PIL import Image, ImageDraw, ImageFont
-import io
-import numpy as np
 import os
-from fpdf import FPDF
-import gspread
-from google.oauth2.service_account import Credentials
+import tempfile
+from bulk_export import EXPORT_FORMATS, MAX_MERGED_PASSES, export_gate_passes
+from bulk_import import IMPORT_FORMATS, import_gate_passes, import_template, read_import_file
+from gate_check import parse_payload
+from register import (EXPORT_FORMATS as REGISTER_EXPORT_FORMATS, PAGE_SIZE, build_snapshot, export_register,
+                      filter_register, page_count, register_page)
+from references import generate_reference, is_valid_reference, normalize_reference
+from sheets_api import SheetsQuotaExceeded
+from signatures import encode_signature_png
+from storage import (get_sheets_connection, get_signature_store, get_storage_backend, get_offline_journal, get_gate_check,
+                     start_journal_replay, save_gate_pass, get_gate_pass, update_signatures, iter_gate_passes,
+                     list_register_rows, find_items, get_tracer, tracing_admin, StorageUnavailable)
+from tracing import SessionTrace
+from validation import DISPATCH_TYPES, non_empty_items, validate_gate_pass
 
 # Page configuration
 st.set_page_config(
@@ -20,469 +24,629 @@ st.set_page_config(
     layout="centered"
 )
 
-# Google Sheets setup with proper private key handling
-# Robust Google Sheets setup
-# Simple Google Sheets setup using the die-casting project credentials
-def setup_google_sheets():
+# Spans around Sheets setup, storage, signature encoding and PDF rendering; a no-op
+# unless the [tracing] secrets section enables it
+tracer = get_tracer()
+
+# Per-session rerun and storage counters, to see what a sign-off actually costs
+def count_metric(name, amount=1):
+    metrics = st.session_state.setdefault('session_metrics', {})
+    metrics[name] = metrics.get(name, 0) + amount
+
+# Count a script run and, with tracing on, collect the spans it finishes for the tracing
+# panel. Fragments drawn as part of a full rerun belong to that rerun and aren't counted.
+def start_run(kind):
+    if kind == 'full_runs':
+        st.session_state.in_full_run = True
+    elif st.session_state.get('in_full_run'):
+        return
+    count_metric(kind)
+    if tracer.enabled:
+        session_trace = st.session_state.setdefault('session_trace', SessionTrace())
+        tracer.bind(session_trace.start_run(kind))
+
+start_run('full_runs')
+
+# Header, drawn before anything touches storage so the first render never waits on it
+st.markdown("<h1 style='text-align: center; font-size: 16px;'>Advice Dispatch Gate Pass</h1>", unsafe_allow_html=True)
+st.markdown("<h2 style='text-align: center; font-size: 14px;'>Alumex Group</h2>", unsafe_allow_html=True)
+st.markdown("<p style='text-align: center;'>Sapugaskanda, Makola</p>", unsafe_allow_html=True)
+st.markdown("<p style='text-align: center;'>Tel: 2400332,2400333,2400421</p>", unsafe_allow_html=True)
+
+st.markdown("---")
+
+# Google Sheets setup
+# The client and worksheet handle are pooled process-wide by storage.get_sheets_connection,
+# so a rerun only pays for a (rate-limited) health check instead of a full re-authorization.
+# It runs once the page is drawn (see the bottom of the script) and reports into status,
+# a sidebar slot reserved here so the messages still come first.
+@tracer.traced('app.setup_google_sheets')
+def setup_google_sheets(status):
+    connection = get_sheets_connection()
+    if connection is None:
+        status.warning("Google Sheets credentials not found")
+        return None
+
+    import gspread
     try:
-        # Check if secrets are available
-        if 'gcp_service_account' not in st.secrets:
-            st.sidebar.warning("Google Sheets credentials not found")
-            return None
-        
-        # Use the exact structure from secrets
-        service_account_info = dict(st.secrets['gcp_service_account'])
-        
-        # Create credentials with explicit scopes for gspread
-        creds = service_account.Credentials.from_service_account_info(
-            service_account_info,
-            scopes=[
-                'https://www.googleapis.com/auth/spreadsheets',
-                'https://www.googleapis.com/auth/drive'
-            ]
-        )
-        
-        # Authorize gspread client
-        client = gspread.authorize(creds)
-        
-        # Try to open the sheet
-        try:
-            sheet = client.open("Alumex_Gate_Passes").sheet1
-            st.sidebar.success("✅ Connected to Google Sheets!")
-            return sheet
-            
-        except gspread.SpreadsheetNotFound:
-            # Create new sheet if it doesn't exist
-            try:
-                spreadsheet = client.create("Alumex_Gate_Passes")
-                
-                # Share the spreadsheet with the service account for full access
-                spreadsheet.share(service_account_info['client_email'], perm_type='user', role='writer')
-                
-                sheet = spreadsheet.sheet1
-                headers = [
-                    "Reference", "Requested_By", "Send_To", "Purpose", 
-                    "Return_Date", "Dispatch_Type", "Vehicle_Number",
-                    "Items_JSON", "Certified_Signature", "Authorized_Signature",
-                    "Received_Signature", "Status", "Created_Date", "Completed_Date"
-                ]
-                sheet.append_row(headers)
-                st.sidebar.success("✅ Created new Google Sheet!")
-                return sheet
-                
-            except Exception as create_error:
-                st.sidebar.error(f"❌ Failed to create Google Sheet: {str(create_error)}")
-                return None
-                
-        except gspread.APIError as api_error:
-            st.sidebar.error(f"❌ Google Sheets API Error: {str(api_error)}")
-            return None
-            
+        # One quick attempt: a rerun never waits out retries or another thread's connect
+        with connection.api.fail_fast():
+            connection.worksheet()
+        if connection.created_sheet:
+            status.success("✅ Created new Google Sheet!")
+        else:
+            status.success("✅ Connected to Google Sheets!")
+        return connection
+
+    except (StorageUnavailable, SheetsQuotaExceeded) as e:
+        status.warning(f"⏳ {e}")
+        return None
+
+    except gspread.exceptions.APIError as api_error:
+        status.error(f"❌ Google Sheets API Error: {str(api_error)}")
+        return None
+
     except Exception as e:
-        st.sidebar.error(f"❌ Google Sheets setup failed: {str(e)}")
+        status.error(f"❌ Google Sheets setup failed: {str(e)}")
         
         # Show more detailed error for debugging
         if "invalid_scope" in str(e).lower():
-            st.sidebar.error("Scope error - check OAuth scopes in credentials")
+            status.error("Scope error - check OAuth scopes in credentials")
         elif "padding" in str(e).lower():
-            st.sidebar.error("Private key formatting error - check secrets format")
+            status.error("Private key formatting error - check secrets format")
         elif "unauthorized" in str(e).lower() or "permission" in str(e).lower():
-            st.sidebar.error("Permission denied - make sure the sheet is shared with the service account")
+            status.error("Permission denied - make sure the sheet is shared with the service account")
         elif "key" in str(e).lower():
-            st.sidebar.error("Invalid private key - check key format in secrets")
+            status.error("Invalid private key - check key format in secrets")
             
         return None
 
-# Initialize Google Sheets
-gate_pass_sheet = setup_google_sheets()
+sheets_status = st.sidebar.container()
 
-# Header
-st.markdown("<h1 style='text-align: center; font-size: 16px;'>Advice Dispatch Gate Pass</h1>", unsafe_allow_html=True)
-st.markdown("<h2 style='text-align: center; font-size: 14px;'>Alumex Group</h2>", unsafe_allow_html=True)
-st.markdown("<p style='text-align: center;'>Sapugaskanda, Makola</p>", unsafe_allow_html=True)
-st.markdown("<p style='text-align: center;'>Tel: 2400332,2400333,2400421</p>", unsafe_allow_html=True)
+# Initialize storage (local SQLite with write-behind to Google Sheets by default)
+storage_backend = get_storage_backend()
+storage_status = storage_backend.status() if storage_backend is not None else ""
+if storage_status:
+    st.sidebar.info(storage_status)
 
-st.markdown("---")
+# Passes saved while storage was unreachable are journaled on disk and replayed once it is back
+offline_journal = get_offline_journal()
+if offline_journal.pending_count():
+    st.sidebar.warning(f"{offline_journal.pending_count()} gate pass(es) saved offline, waiting to sync")
+    start_journal_replay(storage_backend, offline_journal)
 
-# Function to generate reference number
-def generate_reference(data):
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    hash_input = f"{data['requested_by']}{timestamp}"
-    return f"GP{hashlib.md5(hash_input.encode()).hexdigest()[:8].upper()}"
+# Signature images live in a content-addressed blob store shared through the sheet; gate pass
+# rows keep only their hash, or the image inline while the shared store can't be reached
+signature_store = get_signature_store()
 
-# Function to save gate pass
-def save_gate_pass(data):
-    try:
-        if gate_pass_sheet is None:
-            # Fallback to session state
-            if 'local_gate_passes' not in st.session_state:
-                st.session_state.local_gate_passes = {}
-            st.session_state.local_gate_passes[data['reference']] = data
-            return True
-        
-        # Save to Google Sheets
-        items_json = json.dumps(data['items'])
-        row_data = [
-            data['reference'], data['requested_by'], data['send_to'], data['purpose'],
-            data.get('return_date', ''), data['dispatch_type'], data.get('vehicle_number', ''),
-            items_json, data.get('certified_signature', ''), '', '',
-            'pending', datetime.datetime.now().isoformat(), ''
-        ]
-        gate_pass_sheet.append_row(row_data)
-        return True
+# Builds and verifies the QR code printed on every pass
+gate_check = get_gate_check()
+
+# PDF download served over Streamlit's media endpoint: the rerun itself only carries
+# the button and a file URL, and the bytes come from the rendered-PDF cache.
+# on_click="ignore" keeps the button from triggering a rerun that would hide it.
+# FPDF and qrcode are only imported once a pass is submitted or signed off.
+def pdf_download_button(gate_pass_data, filename, label, key):
+    from gate_pass_pdf import render_gate_pass_pdf
+    st.download_button(
+        label,
+        data=render_gate_pass_pdf(gate_pass_data, signature_store, gate_check),
+        file_name=filename,
+        mime="application/pdf",
+        type="primary",
+        on_click="ignore",
+        key=key,
+    )
+
+def session_metrics_panel():
+    metrics = st.session_state.get('session_metrics', {})
+    with st.sidebar.expander("⏱ Session metrics"):
+        sign_offs = metrics.get('sign_offs', 0)
+        st.write(f"Full reruns: {metrics.get('full_runs', 0)}")
+        st.write(f"Fragment reruns: {metrics.get('fragment_runs', 0)}")
+        st.write(f"Storage lookups: {metrics.get('lookups', 0)}")
+        st.write(f"Sign-offs: {sign_offs}")
+        if sign_offs:
+            st.write(f"Full reruns per sign-off: {metrics.get('full_runs', 0) / sign_offs:.1f}")
+            st.write(f"Sheets calls per sign-off: {metrics.get('sign_off_api_calls', 0) / sign_offs:.1f}")
+
+def span_table(totals):
+    return pd.DataFrame([
+        {
+            'Span': name,
+            'Calls': entry['count'],
+            'Total ms': round(entry['seconds'] * 1000, 1),
+            'Mean ms': round(entry['seconds'] * 1000 / entry['count'], 1),
+            'Bytes': entry['bytes'],
+            'Sheets calls': entry['api_calls'],
+            'Errors': entry['errors'],
+        }
+        for name, entry in sorted(totals.items(), key=lambda item: -item[1]['seconds'])
+    ], columns=['Span', 'Calls', 'Total ms', 'Mean ms', 'Bytes', 'Sheets calls', 'Errors'])
+
+# Where the time went, for admins: open the app with ?admin=<[tracing] admin_token>
+def tracing_panel():
+    if not tracer.enabled or not tracing_admin(st.query_params.get('admin', '')):
+        return
+    session_trace = st.session_state.get('session_trace')
+    with st.sidebar.expander("🔎 Tracing"):
+        if session_trace is not None and session_trace.current is not None:
+            st.caption("This rerun")
+            st.dataframe(span_table(session_trace.current.totals), hide_index=True)
+            st.caption(f"This session ({session_trace.runs} runs)")
+            st.dataframe(span_table(session_trace.totals()), hide_index=True)
+        st.caption("All sessions")
+        st.dataframe(span_table(tracer.totals()), hide_index=True)
+        for name, stats in tracer.collected().items():
+            st.caption(name.replace('_', ' ').capitalize())
+            st.json(stats)
+
+# Each canvas is its own fragment: a stroke reruns only this canvas, and the latest
+# image is left in session state for the submit fragment to pick up.
+@st.fragment
+def signature_canvas(label, key):
+    start_run('fragment_runs')
+    st.markdown(f"**{label}**")
+    st.write("Draw your signature in the box below:")
+    
+    from streamlit_drawable_canvas import st_canvas
+    canvas_result = st_canvas(
+        fill_color="rgba(255, 255, 255, 0)",
+        stroke_width=4,
+        stroke_color="#000000",
+        background_color="#ffffff",
+        background_image=None,
+        update_streamlit=True,
+        height=120,
+        width=400,
+        drawing_mode="freedraw",
+        point_display_radius=0,
+        key=key,
+    )
+    st.session_state[f"{key}_image"] = canvas_result.image_data
+
+def canvas_image(key):
+    return st.session_state.get(f"{key}_image")
+
+# Month-end audit export: every matching pass rendered on a process pool into one archive
+def bulk_export_panel():
+    with st.sidebar.expander("📦 Bulk PDF Export"):
+        start_date = st.date_input("From", value=date.today().replace(day=1), key="export_start")
+        end_date = st.date_input("To", value=date.today(), key="export_end")
+        dispatch_type = st.selectbox("Dispatch type", ["All"] + DISPATCH_TYPES, key="export_dispatch_type")
+        export_format = st.radio("Format", list(EXPORT_FORMATS), format_func=lambda f: EXPORT_FORMATS[f][0],
+                                 key="export_format")
         
-    except Exception as e:
-        st.error(f"Error saving: {e}")
-        # Fallback
-        if 'local_gate_passes' not in st.session_state:
-            st.session_state.local_gate_passes = {}
-        st.session_state.local_gate_passes[data['reference']] = data
-        return True
-
-# Function to get gate pass by reference
-def get_gate_pass(reference):
-    try:
-        if gate_pass_sheet is not None:
-            # Try Google Sheets first
-            records = gate_pass_sheet.get_all_records()
-            for record in records:
-                if record['Reference'] == reference:
-                    return {
-                        'reference': record['Reference'],
-                        'requested_by': record['Requested_By'],
-                        'send_to': record['Send_To'],
-                        'purpose': record['Purpose'],
-                        'return_date': record['Return_Date'],
-                        'dispatch_type': record['Dispatch_Type'],
-                        'vehicle_number': record['Vehicle_Number'],
-                        'items': json.loads(record['Items_JSON']),
-                        'certified_signature': record['Certified_Signature'],
-                        'authorized_signature': record['Authorized_Signature'],
-                        'received_signature': record['Received_Signature'],
-                        'status': record['Status']
-                    }
+        if export_format == 'pdf':
+            st.caption(f"Up to {MAX_MERGED_PASSES} gate passes; use the ZIP for longer ranges.")
         
-        # Fallback to session state
-        if 'local_gate_passes' in st.session_state:
-            return st.session_state.local_gate_passes.get(reference)
+        if st.button("Export", key="export_button"):
+            # Passes stream from storage into the renderers; the range is never held in memory
+            gate_passes = iter_gate_passes(storage_backend, start_date, end_date,
+                                           None if dispatch_type == "All" else dispatch_type)
+            status = st.empty()
             
-        return None
-        
-    except Exception as e:
-        # Fallback to session state
-        if 'local_gate_passes' in st.session_state:
-            return st.session_state.local_gate_passes.get(reference)
-        return None
+            def report_progress(done, total):
+                status.caption(f"Rendered {done} gate passes...")
+            
+            with tempfile.NamedTemporaryFile(suffix=f".{export_format}", delete=False) as output:
+                archive_path = output.name
+            try:
+                exported = export_gate_passes(gate_passes, archive_path, export_format, signature_store,
+                                              progress=report_progress, gate_check=gate_check)
+                if not exported:
+                    status.empty()
+                    st.warning("No gate passes match these filters")
+                    return
+                status.caption(f"Exported {exported} gate passes")
+                with open(archive_path, 'rb') as archive:
+                    st.download_button("⬇️ Download Export", data=archive,
+                                       file_name=f"gate_passes_{start_date}_{end_date}.{export_format}",
+                                       mime=EXPORT_FORMATS[export_format][1], on_click="ignore")
+            except Exception as e:
+                st.error(f"Error exporting gate passes: {e}")
+            finally:
+                os.remove(archive_path)
 
-# Function to update signatures
-def update_signatures(reference, certified_sig, authorized_sig, received_sig, vehicle_no):
-    try:
-        if gate_pass_sheet is not None:
-            # Update in Google Sheets
-            records = gate_pass_sheet.get_all_records()
-            for i, record in enumerate(records):
-                if record['Reference'] == reference:
-                    row_num = i + 2
-                    gate_pass_sheet.update_cell(row_num, 10, authorized_sig)
-                    gate_pass_sheet.update_cell(row_num, 11, received_sig)
-                    gate_pass_sheet.update_cell(row_num, 7, vehicle_no)
-                    gate_pass_sheet.update_cell(row_num, 12, 'completed')
-                    return True
+# Project shipments arrive as spreadsheets of many passes: validated with the submit
+# rules, given references in one go and written in batches
+def bulk_import_panel():
+    with st.sidebar.expander("📥 Bulk Import"):
+        st.download_button("Download template", data=import_template(), file_name="gate_pass_import.csv",
+                           mime="text/csv", on_click="ignore")
+        upload = st.file_uploader("CSV or Excel file", type=IMPORT_FORMATS, key="import_file")
+        if upload is None:
+            return
         
-        # Fallback to session state
-        if 'local_gate_passes' in st.session_state and reference in st.session_state.local_gate_passes:
-            st.session_state.local_gate_passes[reference]['authorized_signature'] = authorized_sig
-            st.session_state.local_gate_passes[reference]['received_signature'] = received_sig
-            st.session_state.local_gate_passes[reference]['vehicle_number'] = vehicle_no
-            st.session_state.local_gate_passes[reference]['status'] = 'completed'
-            return True
+        if st.button("Import", key="import_button"):
+            try:
+                frame = read_import_file(upload, upload.name)
+            except Exception as e:
+                st.error(f"Could not read {upload.name}: {e}")
+                return
             
-        return False
-        
-    except Exception as e:
-        st.error(f"Error updating: {e}")
-        return False
-
-# PDF creation function
-def create_gate_pass_pdf(gate_pass_data):
-    class PDFWithFooter(FPDF):
-        def footer(self):
-            self.set_y(-15)
-            self.set_font('Arial', 'I', 9)
-            current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.cell(0, 10, f'Generated on: {current_date} | Page {self.page_no()}', 0, 0, 'C')
-    
-    pdf = PDFWithFooter(format='A4')
-    pdf.add_page()
-    pdf.set_margins(left=15, top=15, right=15)
-    pdf.set_auto_page_break(auto=True, margin=15)
-    
-    # Header
-    pdf.set_font("Arial", 'B', 18)
-    pdf.cell(0, 10, "ADVICE DISPATCH GATE PASS", ln=True, align='C')
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(0, 8, "ALUMEX GROUP", ln=True, align='C')
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 6, "Sapugaskanda, Makola", ln=True, align='C')
-    pdf.cell(0, 6, "Tel: 2400332,2400333,2400421", ln=True, align='C')
-    
-    pdf.ln(8)
+            progress_bar = st.progress(0.0, text="Importing...")
+            
+            def report_progress(done, total):
+                progress_bar.progress(done / total, text=f"Saved {done} of {total}")
+            
+            try:
+                result, errors = import_gate_passes(storage_backend, frame, progress=report_progress)
+            except Exception as e:
+                st.error(f"Error importing gate passes: {e}")
+                return
+            throughput = result.throughput()
+            st.success(f"Imported {result.imported} gate pass(es) from {result.rows} row(s) "
+                       f"({throughput['rows_per_second']:.0f} rows/s, "
+                       f"{throughput['passes_per_second']:.0f} passes/s written)")
+            if result.journaled:
+                st.warning(f"{result.journaled} pass(es) saved to the offline journal; they will sync automatically.")
+            if result.references:
+                references = pd.DataFrame(list(result.references.items()), columns=["Row", "Reference"])
+                st.download_button("⬇️ Download References", data=references.to_csv(index=False).encode('utf-8'),
+                                   file_name=f"imported_{upload.name}.csv", mime="text/csv", on_click="ignore")
+            if errors:
+                st.error(f"{len(errors)} problem(s); these rows were not imported:")
+                st.dataframe(pd.DataFrame(errors, columns=["Row", "Error"]), hide_index=True)
+
+def empty_items_df():
+    return pd.DataFrame({
+        'Quantity': ['', '', ''],
+        'Description': ['', '', ''],
+        'Total Value': ['', '', ''],
+        'Invoice No': ['', '', '']
+    })
+
+# Create form fields and the items editor; edits rerun only this fragment
+@st.fragment
+def create_details_fragment():
+    start_run('fragment_runs')
+    col1, col2 = st.columns(2)
     
-    # Reference Number
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 8, f"Reference: {gate_pass_data['reference']}", ln=True, align='L')
-    pdf.ln(5)
+    with col1:
+        st.text_input("1. Requested by (Name of the Executive)", key="new_requested_by")
+        st.text_area("2. Send to (Name & Address)", height=100, key="new_send_to")
+        st.text_area("3. Purpose of sending", height=80, key="new_purpose")
     
-    # Basic Information
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "BASIC INFORMATION", ln=True, align='L')
-    pdf.set_font("Arial", size=11)
+    with col2:
+        st.write("4. Tentative returnable date (Optional)")
+        # FIXED: Added proper label to avoid warning
+        st.date_input("Return Date", value=None, min_value=date.today(), label_visibility="collapsed",
+                      key="new_return_date")
+        st.selectbox("5. Type of dispatch", 
+                     DISPATCH_TYPES, key="new_dispatch_type")
+        st.text_input("6. Vehicle Number", placeholder="Enter vehicle number", key="new_vehicle_number")
     
-    info_data = [
-        ("Requested by:", gate_pass_data['requested_by']),
-        ("Send to:", gate_pass_data['send_to']),
-        ("Purpose:", gate_pass_data['purpose']),
-        ("Return Date:", gate_pass_data.get('return_date', 'Not specified')),
-        ("Dispatch Type:", gate_pass_data['dispatch_type']),
-        ("Vehicle Number:", gate_pass_data.get('vehicle_number', ''))
-    ]
+    st.subheader("Details of items Dispatch")
     
-    for label, value in info_data:
-        pdf.set_font("Arial", 'B', 11)
-        pdf.cell(45, 7, label, 0, 0)
-        pdf.set_font("Arial", size=11)
-        pdf.cell(0, 7, str(value), ln=True)
+    if 'items_df' not in st.session_state:
+        st.session_state.items_df = empty_items_df()
     
-    pdf.ln(8)
+    st.write("**Add items below (you can add/delete rows as needed):**")
+    # FIXED: Replaced use_container_width with width
+    st.session_state.items_edited = st.data_editor(
+        st.session_state.items_df,
+        num_rows="dynamic",
+        width='stretch',  # Changed from use_container_width=True
+        key="items_editor",
+        column_config={
+            "Quantity": st.column_config.TextColumn(width="small"),
+            "Description": st.column_config.TextColumn(width="large"),
+            "Total Value": st.column_config.TextColumn(width="medium"),
+            "Invoice No": st.column_config.TextColumn(width="medium")
+        }
+    )
+
+@st.fragment
+def create_submit_fragment():
+    start_run('fragment_runs')
+    last_created = st.session_state.get('last_created_pass')
+    if last_created is not None:
+        reference = last_created['reference']
+        st.success(f"🎉 Gate Pass submitted successfully!")
+        st.info(f"**Your Reference Number:** **{reference}**")
+        st.warning("📝 Please share this reference number with authorized personnel for signing.")
+        
+        st.markdown("---")
+        st.markdown("### 📥 Download Your Gate Pass")
+        pdf_download_button(last_created, f"gate_pass_{reference}.pdf", "⬇️ Download PDF",
+                            key="download_new_pass")
+        st.markdown("---")
     
-    # Items Table
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "ITEMS DISPATCH DETAILS", ln=True, align='L')
-    pdf.ln(5)
+    if st.button("✅ Submit Gate Pass", type="primary"):
+        return_date = st.session_state.get('new_return_date')
+        gate_pass_data = {
+            'requested_by': st.session_state.get('new_requested_by', ''),
+            'send_to': st.session_state.get('new_send_to', ''),
+            'purpose': st.session_state.get('new_purpose', ''),
+            'return_date': return_date.strftime("%Y-%m-%d") if return_date else "",
+            'dispatch_type': st.session_state.new_dispatch_type,
+            'vehicle_number': st.session_state.get('new_vehicle_number', ''),
+            'items': non_empty_items(st.session_state.items_edited.to_dict('records'))
+        }
+        
+        errors = validate_gate_pass(gate_pass_data)
+        if errors:
+            st.error(errors[0])
+            return
+        
+        certified_signature = signature_store.put(encode_signature_png(canvas_image("certified_canvas_new")))
+        if certified_signature is None:
+            st.error("Please provide certified signature")
+            return
+        
+        reference = generate_reference()
+        gate_pass_data['reference'] = reference
+        gate_pass_data['certified_signature'] = certified_signature
+        
+        if save_gate_pass(storage_backend, gate_pass_data):
+            st.session_state.last_created_pass = gate_pass_data
+            st.session_state.items_df = empty_items_df()
+            # One full rerun so the items editor picks up its reset
+            st.rerun()
+
+# Lookups fire only for complete, well-formed references and found passes are
+# memoized for the session, so reruns never repeat a storage round trip.
+# Raises StorageUnavailable when storage can't answer; that isn't memoized either.
+def lookup_gate_pass(reference):
+    lookups = st.session_state.setdefault('gate_pass_lookups', {})
+    if reference not in lookups:
+        count_metric('lookups')
+        gate_pass = get_gate_pass(storage_backend, reference)
+        if gate_pass is None:
+            # Not memoized: the pass may be created moments later
+            return None
+        lookups[reference] = gate_pass
+    return lookups[reference]
+
+@st.fragment
+def reference_lookup_fragment():
+    start_run('fragment_runs')
+    reference_input = st.text_input("Enter Reference Number", placeholder="e.g., GP2J2KSHT3007QS",
+                                    key="reference_input")
+    # Accepts a typed reference or the text of a scanned QR code
+    reference = parse_payload(reference_input)[0] if reference_input else ""
     
-    # Table headers
-    pdf.set_font("Arial", 'B', 11)
-    col_widths = [20, 100, 30, 35]
-    headers = ["Qty", "Description", "Value", "Invoice No"]
+    if reference and not is_valid_reference(reference):
+        st.info("Enter the complete reference number printed on the gate pass.")
+        reference = ""
     
-    for i, header in enumerate(headers):
-        pdf.cell(col_widths[i], 10, header, 1, 0, 'C')
-    pdf.ln()
+    if reference != st.session_state.get('signing_reference', ""):
+        st.session_state.signing_reference = reference
+        # The rest of the tab depends on which pass is open
+        st.rerun()
+
+@st.fragment
+def sign_off_fragment(gate_pass_data):
+    start_run('fragment_runs')
+    reference = gate_pass_data['reference']
+    vehicle_number = st.text_input("Vehicle Number", 
+                                   value=gate_pass_data.get('vehicle_number', ''),
+                                   placeholder="Enter vehicle number",
+                                   key=f"sign_vehicle_{reference}")
     
-    # Table rows
-    pdf.set_font("Arial", size=10)
-    for item in gate_pass_data['items']:
-        pdf.cell(col_widths[0], 8, str(item.get('Quantity', '')), 1, 0, 'C')
+    if st.button("✅ Submit All Signatures", type="primary"):
+        authorized_sig = signature_store.put(encode_signature_png(canvas_image("authorized_canvas")))
+        received_sig = signature_store.put(encode_signature_png(canvas_image("received_canvas")))
         
-        desc = str(item.get('Description', ''))
-        if len(desc) > 40:
-            desc = desc[:37] + "..."
-        pdf.cell(col_widths[1], 8, desc, 1, 0, 'L')
+        if (authorized_sig is not None and 
+            received_sig is not None and 
+            vehicle_number):
+            
+            result = update_signatures(storage_backend, reference, 
+                                       gate_pass_data.get('certified_signature', ''),
+                                       authorized_sig, 
+                                       received_sig, 
+                                       vehicle_number,
+                                       gate_pass=gate_pass_data)
+            if result:
+                count_metric('sign_offs')
+                count_metric('sign_off_api_calls', result.api_calls)
+                
+                updated_data = gate_pass_data.copy()
+                updated_data['authorized_signature'] = authorized_sig
+                updated_data['received_signature'] = received_sig
+                updated_data['vehicle_number'] = vehicle_number
+                updated_data['status'] = 'completed'
+                st.session_state.gate_pass_lookups[reference] = updated_data
+                
+                st.success("🎉 All signatures submitted successfully! Gate Pass is now completed.")
+                st.markdown("---")
+                st.markdown("### 📥 Download Completed Gate Pass")
+                pdf_download_button(updated_data, f"gate_pass_{reference}.pdf",
+                                    "⬇️ Download Completed Gate Pass (PDF)", key="download_completed_pass")
+        else:
+            st.error("❌ Please provide all signatures and vehicle number")
+
+# Seconds between rebuilds of the shared dispatch register snapshot
+REGISTER_TTL = 60
+
+# One register snapshot for every session, rebuilt at most once per REGISTER_TTL, so
+# filtering and paging never touch storage. Sessions must treat it as read-only.
+@st.cache_resource(ttl=REGISTER_TTL, show_spinner="Loading dispatch register...")
+def get_register_snapshot():
+    return build_snapshot(list_register_rows(storage_backend))
+
+# Finance extracts: the register's current filters, streamed from storage in chunks
+def register_export_panel(filters):
+    with st.expander("⬇️ Export register"):
+        export_format = st.radio("Format", list(REGISTER_EXPORT_FORMATS),
+                                 format_func=lambda f: REGISTER_EXPORT_FORMATS[f][0],
+                                 horizontal=True, key="register_export_format")
+        include_signatures = st.checkbox("Include signature columns", key="register_export_signatures")
         
-        pdf.cell(col_widths[2], 8, str(item.get('Total Value', '')), 1, 0, 'C')
-        pdf.cell(col_widths[3], 8, str(item.get('Invoice No', '')), 1, 0, 'C')
-        pdf.ln()
+        if st.button("Export", key="register_export_button"):
+            if storage_backend is None:
+                st.error("Storage is not configured")
+                return
+            status = st.empty()
+            
+            def report_progress(written):
+                status.caption(f"Exported {written} gate passes...")
+            
+            with tempfile.NamedTemporaryFile(suffix=f".{export_format}", delete=False) as output:
+                export_path = output.name
+            try:
+                written = export_register(storage_backend, export_path, export_format, filters,
+                                          include_signatures=include_signatures, progress=report_progress)
+                status.caption(f"Exported {written} gate passes")
+                with open(export_path, 'rb') as export:
+                    st.download_button("⬇️ Download Register", data=export,
+                                       file_name=f"gate_pass_register_{date.today()}.{export_format}",
+                                       mime=REGISTER_EXPORT_FORMATS[export_format][1], on_click="ignore")
+            except Exception as e:
+                st.error(f"Error exporting the register: {e}")
+            finally:
+                os.remove(export_path)
+
+# st.tabs draws every tab on every run, so the snapshot is only built once the register
+# is switched on; flipping the toggle reruns just this fragment
+@st.fragment
+def dispatch_register_fragment():
+    start_run('fragment_runs')
+    if not st.toggle("Show dispatch register", key="register_open"):
+        st.caption("Switch on to load the register of all gate passes.")
+        return
+    snapshot = get_register_snapshot()
     
-    pdf.ln(12)
+    col1, col2 = st.columns(2)
+    with col1:
+        date_range = st.date_input("Created between", value=(), key="register_dates")
+        dispatch_types = st.multiselect("Type of dispatch", DISPATCH_TYPES, key="register_dispatch_types")
+        statuses = st.multiselect("Status", ["pending", "completed"], key="register_statuses")
+    with col2:
+        requester = st.text_input("Requested by", key="register_requester")
+        vehicle_number = st.text_input("Vehicle Number", key="register_vehicle")
+        if st.button("🔄 Refresh register"):
+            get_register_snapshot.clear()
+            st.rerun(scope="fragment")
     
-    # Signatures section
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "AUTHORIZATIONS & SIGNATURES", ln=True, align='C')
-    pdf.ln(8)
+    filters = {
+        'start_date': date_range[0] if len(date_range) > 0 else None,
+        'end_date': date_range[1] if len(date_range) > 1 else None,
+        'dispatch_types': dispatch_types,
+        'statuses': statuses,
+        'requester': requester,
+        'vehicle_number': vehicle_number,
+    }
+    matches = filter_register(snapshot, **filters)
     
-    # Signature boxes
-    col_width = 55
-    spacing = 10
-    start_x = 15
+    register_export_panel(filters)
     
-    signatures = [
-        ("CERTIFIED BY", "Certifying Officer", gate_pass_data.get('certified_signature')),
-        ("AUTHORIZED BY", "Authorizing Manager", gate_pass_data.get('authorized_signature')),
-        ("RECEIVED BY", "Receiving Party", gate_pass_data.get('received_signature'))
-    ]
+    if matches.empty:
+        st.info("No gate passes match these filters.")
+        return
     
-    # Signature titles
-    pdf.set_font("Arial", 'B', 11)
-    for i, (title, label, signature) in enumerate(signatures):
-        x_position = start_x + (i * (col_width + spacing))
-        pdf.set_xy(x_position, pdf.get_y())
-        pdf.cell(col_width, 6, title, 0, 0, 'C')
+    pages = page_count(len(matches))
+    # No key: the page resets to 1 whenever the filters change the page count
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+    first = (page - 1) * PAGE_SIZE + 1
+    shown = register_page(matches, page)
+    st.caption(f"Showing {first}–{first + len(shown) - 1} of {len(matches)} gate passes "
+               f"(refreshed every {REGISTER_TTL} seconds)")
+    st.dataframe(
+        shown,
+        width='stretch',
+        hide_index=True,
+        column_config={
+            "Created": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+            "Total_Value": st.column_config.NumberColumn(format="%.2f"),
+        }
+    )
+
+# "Which gate pass carried invoice X / where did item Y go", answered from the item index
+@st.fragment
+def item_search_fragment():
+    start_run('fragment_runs')
+    col1, col2 = st.columns(2)
+    with col1:
+        invoice_no = st.text_input("Invoice No", key="item_search_invoice")
+    with col2:
+        description = st.text_input("Item description", placeholder="e.g., window frame",
+                                    key="item_search_description")
     
-    pdf.ln(8)
+    if not invoice_no.strip() and not description.strip():
+        return
     
-    # Signature boxes
-    current_y = pdf.get_y()
-    for i, (title, label, signature) in enumerate(signatures):
-        x_position = start_x + (i * (col_width + spacing))
-        pdf.rect(x_position, current_y, col_width, 25)
-        
-        if signature and signature.strip():
-            try:
-                sig_img_data = base64.b64decode(signature.split(',')[1])
-                sig_img = Image.open(io.BytesIO(sig_img_data))
-                temp_file = f"temp_sig_{i}.png"
-                sig_img.save(temp_file)
-                pdf.image(temp_file, x=x_position + 2, y=current_y + 2, w=col_width - 4, h=21)
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            except:
-                pdf.set_font("Arial", 'I', 8)
-                pdf.set_xy(x_position, current_y + 10)
-                pdf.cell(col_width, 5, "SIGNED", 0, 0, 'C')
-        else:
-            pdf.set_font("Arial", 'I', 8)
-            pdf.set_xy(x_position, current_y + 10)
-            pdf.cell(col_width, 5, "Signature", 0, 0, 'C')
+    items = find_items(storage_backend, invoice_no=invoice_no, text=description)
+    if not items:
+        st.info("No items found.")
+        return
+    st.dataframe(
+        pd.DataFrame(items, columns=['reference', 'Quantity', 'Description', 'Total Value', 'Invoice No']),
+        width='stretch',
+        hide_index=True
+    )
+
+# Gate-check mode (?ref=...&v=..., the QR code on the PDF): one keyed lookup and the
+# pass status, without building the forms, canvases or register
+def gate_check_view():
+    reference = normalize_reference(st.query_params.get("ref", ""))
+    code = st.query_params.get("v", "")
+    st.subheader("Gate Check")
     
-    pdf.ln(30)
+    if not is_valid_reference(reference):
+        st.error("❌ This is not a valid gate pass reference.")
+        return
     
-    # Labels under signatures
-    pdf.set_font("Arial", size=9)
-    for i, (title, label, signature) in enumerate(signatures):
-        x_position = start_x + (i * (col_width + spacing))
-        pdf.set_xy(x_position, pdf.get_y())
-        pdf.cell(col_width, 5, label, 0, 0, 'C')
+    try:
+        gate_pass_data = get_gate_pass(storage_backend, reference)
+    except StorageUnavailable as e:
+        st.warning(f"⏳ {e}")
+        if st.button("Try again"):
+            st.rerun()
+        return
+    if gate_pass_data is None:
+        st.error(f"❌ Gate Pass {reference} not found.")
+        return
     
-    return pdf
-
-def get_pdf_download_link(pdf, filename, text):
-    pdf_output = pdf.output(dest='S').encode('latin-1')
-    b64 = base64.b64encode(pdf_output).decode()
-    href = f'<a href="data:application/pdf;base64,{b64}" download="{filename}" style="background-color: #4CAF50; color: white; padding: 15px 30px; text-align: center; text-decoration: none; display: inline-block; border-radius: 8px; font-size: 16px; font-weight: bold;">{text}</a>'
-    return href
-
-def signature_canvas(label, key):
-    st.markdown(f"**{label}**")
-    st.write("Draw your signature in the box below:")
+    if code and not gate_check.verify(reference, code):
+        st.error("⚠️ QR code verification failed. Do not release goods against this pass.")
+        return
     
-    from streamlit_drawable_canvas import st_canvas
-    canvas_result = st_canvas(
-        fill_color="rgba(255, 255, 255, 0)",
-        stroke_width=4,
-        stroke_color="#000000",
-        background_color="#ffffff",
-        background_image=None,
-        update_streamlit=True,
-        height=120,
-        width=400,
-        drawing_mode="freedraw",
-        point_display_radius=0,
-        key=key,
-    )
-    return canvas_result
+    if gate_pass_data.get('status') == 'completed':
+        st.success(f"✅ {reference}: CLEARED. All signatures collected.")
+    else:
+        st.error(f"⛔ {reference}: NOT CLEARED. Waiting for signatures.")
+    
+    st.write(f"**Requested by:** {gate_pass_data['requested_by']}")
+    st.write(f"**Send to:** {gate_pass_data['send_to']}")
+    st.write(f"**Dispatch Type:** {gate_pass_data['dispatch_type']}")
+    st.write(f"**Vehicle Number:** {gate_pass_data.get('vehicle_number', '')}")
+    st.dataframe(pd.DataFrame(gate_pass_data['items']), width='stretch', hide_index=True)
+    
+    if st.button("Check another pass"):
+        st.query_params.clear()
+        st.rerun()
 
 # Main app logic
 def main():
-    tab1, tab2 = st.tabs(["Create New Gate Pass", "Sign Existing Gate Pass"])
+    bulk_export_panel()
+    bulk_import_panel()
+    session_metrics_panel()
+    
+    tab1, tab2, tab3 = st.tabs(["Create New Gate Pass", "Sign Existing Gate Pass", "Dispatch Register"])
     
     with tab1:
         st.subheader("Create New Gate Pass")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            requested_by = st.text_input("1. Requested by (Name of the Executive)")
-            send_to = st.text_area("2. Send to (Name & Address)", height=100)
-            purpose = st.text_area("3. Purpose of sending", height=80)
-        
-        with col2:
-            st.write("4. Tentative returnable date (Optional)")
-            # FIXED: Added proper label to avoid warning
-            return_date = st.date_input("Return Date", value=None, min_value=date.today(), label_visibility="collapsed")
-            dispatch_type = st.selectbox("5. Type of dispatch", 
-                                       ["Credit Sale", "Cash Sale", "Returnable", "Non Returnable"])
-            vehicle_number = st.text_input("6. Vehicle Number", placeholder="Enter vehicle number")
-        
-        st.subheader("Details of items Dispatch")
-        
-        if 'items_df' not in st.session_state:
-            st.session_state.items_df = pd.DataFrame({
-                'Quantity': ['', '', ''],
-                'Description': ['', '', ''],
-                'Total Value': ['', '', ''],
-                'Invoice No': ['', '', '']
-            })
-        
-        st.write("**Add items below (you can add/delete rows as needed):**")
-        # FIXED: Replaced use_container_width with width
-        edited_df = st.data_editor(
-            st.session_state.items_df,
-            num_rows="dynamic",
-            width='stretch',  # Changed from use_container_width=True
-            key="items_editor",
-            column_config={
-                "Quantity": st.column_config.TextColumn(width="small"),
-                "Description": st.column_config.TextColumn(width="large"),
-                "Total Value": st.column_config.TextColumn(width="medium"),
-                "Invoice No": st.column_config.TextColumn(width="medium")
-            }
-        )
+        create_details_fragment()
         
         st.subheader("Certified Signature")
-        certified_canvas = signature_canvas("Draw your signature below:", "certified_canvas_new")
+        signature_canvas("Draw your signature below:", "certified_canvas_new")
         
-        if st.button("✅ Submit Gate Pass", type="primary"):
-            if not requested_by or not send_to or not vehicle_number:
-                st.error("Please fill in all required fields including vehicle number")
-                return
-            
-            items_data = edited_df.to_dict('records')
-            items_data = [item for item in items_data if any(str(value).strip() for value in item.values())]
-            
-            if not items_data:
-                st.error("Please add at least one item")
-                return
-            
-            if certified_canvas.image_data is None:
-                st.error("Please provide certified signature")
-                return
-            
-            gate_pass_data = {
-                'requested_by': requested_by,
-                'send_to': send_to,
-                'purpose': purpose,
-                'return_date': return_date.strftime("%Y-%m-%d") if return_date else "",
-                'dispatch_type': dispatch_type,
-                'vehicle_number': vehicle_number,
-                'items': items_data
-            }
-            
-            reference = generate_reference(gate_pass_data)
-            gate_pass_data['reference'] = reference
-            
-            if certified_canvas.image_data is not None:
-                img_data = certified_canvas.image_data
-                if img_data is not None:
-                    pil_img = Image.fromarray((img_data[:, :, :3]).astype('uint8'))
-                    buffered = io.BytesIO()
-                    pil_img.save(buffered, format="PNG")
-                    img_str = base64.b64encode(buffered.getvalue()).decode()
-                    gate_pass_data['certified_signature'] = f"data:image/png;base64,{img_str}"
-            
-            if save_gate_pass(gate_pass_data):
-                st.success(f"🎉 Gate Pass submitted successfully!")
-                st.info(f"**Your Reference Number:** **{reference}**")
-                st.warning("📝 Please share this reference number with authorized personnel for signing.")
-                
-                gate_pass_pdf = create_gate_pass_pdf(gate_pass_data)
-                st.markdown("---")
-                st.markdown("### 📥 Download Your Gate Pass")
-                st.markdown(get_pdf_download_link(gate_pass_pdf, f"gate_pass_{reference}.pdf", "⬇️ Download PDF"), unsafe_allow_html=True)
-                
-                st.session_state.items_df = pd.DataFrame({
-                    'Quantity': ['', '', ''],
-                    'Description': ['', '', ''],
-                    'Total Value': ['', '', ''],
-                    'Invoice No': ['', '', '']
-                })
+        create_submit_fragment()
     
     with tab2:
         st.subheader("Sign Existing Gate Pass")
         
-        reference_input = st.text_input("Enter Reference Number", placeholder="e.g., GP1A2B3C4D")
+        reference_lookup_fragment()
+        reference = st.session_state.get('signing_reference', "")
         
-        if reference_input:
-            gate_pass_data = get_gate_pass(reference_input)
+        if reference:
+            try:
+                gate_pass_data, lookup_error = lookup_gate_pass(reference), None
+            except StorageUnavailable as e:
+                gate_pass_data, lookup_error = None, e
             
             if gate_pass_data:
                 st.success("✅ Gate Pass Found!")
@@ -498,9 +662,6 @@ def main():
                 with col2:
                     st.text_input("Return Date", value=gate_pass_data.get('return_date', 'Not specified'), disabled=True)
                     st.text_input("Dispatch Type", value=gate_pass_data['dispatch_type'], disabled=True)
-                    vehicle_number = st.text_input("Vehicle Number", 
-                                                 value=gate_pass_data.get('vehicle_number', ''),
-                                                 placeholder="Enter vehicle number")
                 
                 st.subheader("Items Dispatch Details")
                 # FIXED: Replaced use_container_width with width
@@ -514,68 +675,44 @@ def main():
                 with col1:
                     st.write("**Certified Signature**")
                     if gate_pass_data.get('certified_signature') and gate_pass_data['certified_signature'].strip():
-                        st.image(gate_pass_data['certified_signature'], width=200)
+                        certified_png = signature_store.png(gate_pass_data['certified_signature'])
+                        if certified_png is not None:
+                            st.image(certified_png, width=200)
                         st.success("✓ Already signed")
                     else:
                         st.warning("Pending signature")
                 
                 with col2:
                     st.write("**Authorized Signature**")
-                    authorized_canvas = signature_canvas("Draw authorized signature", "authorized_canvas")
+                    signature_canvas("Draw authorized signature", "authorized_canvas")
                 
                 with col3:
                     st.write("**Received Signature**")
-                    received_canvas = signature_canvas("Draw received signature", "received_canvas")
+                    signature_canvas("Draw received signature", "received_canvas")
                 
-                if st.button("✅ Submit All Signatures", type="primary"):
-                    if (authorized_canvas.image_data is not None and 
-                        received_canvas.image_data is not None and 
-                        vehicle_number):
-                        
-                        authorized_sig = None
-                        received_sig = None
-                        
-                        if authorized_canvas.image_data is not None:
-                            img_data = authorized_canvas.image_data
-                            pil_img = Image.fromarray((img_data[:, :, :3]).astype('uint8'))
-                            buffered = io.BytesIO()
-                            pil_img.save(buffered, format="PNG")
-                            img_str = base64.b64encode(buffered.getvalue()).decode()
-                            authorized_sig = f"data:image/png;base64,{img_str}"
-                        
-                        if received_canvas.image_data is not None:
-                            img_data = received_canvas.image_data
-                            pil_img = Image.fromarray((img_data[:, :, :3]).astype('uint8'))
-                            buffered = io.BytesIO()
-                            pil_img.save(buffered, format="PNG")
-                            img_str = base64.b64encode(buffered.getvalue()).decode()
-                            received_sig = f"data:image/png;base64,{img_str}"
-                        
-                        if update_signatures(reference_input, 
-                                          gate_pass_data.get('certified_signature', ''),
-                                          authorized_sig, 
-                                          received_sig, 
-                                          vehicle_number):
-                            
-                            updated_data = gate_pass_data.copy()
-                            updated_data['authorized_signature'] = authorized_sig
-                            updated_data['received_signature'] = received_sig
-                            updated_data['vehicle_number'] = vehicle_number
-                            
-                            gate_pass_pdf = create_gate_pass_pdf(updated_data)
-                            st.success("🎉 All signatures submitted successfully! Gate Pass is now completed.")
-                            st.markdown("---")
-                            st.markdown("### 📥 Download Completed Gate Pass")
-                            st.markdown(get_pdf_download_link(gate_pass_pdf, f"gate_pass_{reference_input}.pdf", "⬇️ Download Completed Gate Pass (PDF)"), unsafe_allow_html=True)
-                    else:
-                        st.error("❌ Please provide all signatures and vehicle number")
+                sign_off_fragment(gate_pass_data)
+            elif lookup_error is not None:
+                st.warning(f"⏳ {lookup_error}")
             else:
                 st.error("❌ Gate Pass not found. Please check the reference number.")
+    
+    with tab3:
+        st.subheader("Dispatch Register")
+        dispatch_register_fragment()
+        
+        st.subheader("Find Items")
+        item_search_fragment()
+    
+    tracing_panel()
 
 if __name__ == "__main__":
-    main()
-
-
-
-
-
+    # Cleared even when the run is cut short (st.rerun, st.stop or an error), so the
+    # next fragment rerun is still counted as one
+    try:
+        if "ref" in st.query_params:
+            gate_check_view()
+        else:
+            main()
+        setup_google_sheets(sheets_status)
+    finally:
+        st.session_state.in_full_run = False
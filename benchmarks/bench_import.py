@@ -0,0 +1,74 @@
+"""Bulk import throughput: parse + validate + batched writes of a generated CSV.
+
+Writes go to a temporary SQLiteBackend. The baseline saves the same passes
+one store.save call at a time, as the create form does.
+
+Usage: python benchmarks/bench_import.py [--passes 5000] [--items 3] [--invalid 0.02] [--batch 500]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_import import IMPORT_COLUMNS, import_gate_passes, parse_import  # noqa: E402
+from references import generate_references  # noqa: E402
+from storage import SQLiteBackend  # noqa: E402
+from validation import DISPATCH_TYPES  # noqa: E402
+
+
+def synthetic_csv(passes, items, invalid, rng):
+    rows = []
+    for number in range(passes):
+        broken = rng.random() < invalid
+        for item in range(items):
+            rows.append([
+                f"P{number}", f"Executive {number % 40}", f"Site {number % 300}, Colombo", "Project shipment",
+                "", rng.choice(DISPATCH_TYPES), "" if broken else f"WP-{rng.randint(1000, 9999)}",
+                str(rng.randint(1, 50)), f"Aluminium profile {rng.randint(1, 500)}",
+                f"{rng.uniform(100, 50000):.2f}", f"INV{rng.randint(1, 99999)}",
+            ])
+    return pd.DataFrame(rows, columns=IMPORT_COLUMNS).to_csv(index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--passes', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=3)
+    parser.add_argument('--invalid', type=float, default=0.02, help="share of passes missing a vehicle number")
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    text = synthetic_csv(args.passes, args.items, args.invalid, random.Random(7))
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        frame = pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
+        read_seconds = time.perf_counter() - start
+
+        store = SQLiteBackend(os.path.join(directory, 'import.db'))
+        result, errors = import_gate_passes(store, frame, batch_size=args.batch)
+        throughput = result.throughput()
+        print(f"{len(frame):,} rows -> {result.imported:,} passes, {len(errors):,} row errors")
+        print(f"read {read_seconds:.2f}s  parse+validate {result.parse_seconds:.2f}s  "
+              f"write {result.write_seconds:.2f}s in {-(-result.imported // args.batch)} batch(es)")
+        print(f"{throughput['rows_per_second']:,.0f} rows/s overall, "
+              f"{throughput['passes_per_second']:,.0f} passes/s written")
+
+        passes, _ = parse_import(frame)
+        baseline = SQLiteBackend(os.path.join(directory, 'baseline.db'))
+        start = time.perf_counter()
+        for (row_number, gate_pass), reference in zip(passes, generate_references(len(passes))):
+            gate_pass['reference'] = reference
+            baseline.save(gate_pass)
+        elapsed = time.perf_counter() - start
+        print(f"baseline one save per pass: {elapsed:.2f}s ({len(passes) / elapsed:,.0f} passes/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Render gate pass PDFs from many threads and check every document is its own.
+
+Each pass gets a distinct reference and distinct signatures. After rendering
+N of them concurrently, every PDF must contain its own reference and its own
+signature image streams and none of the others', and no temp files may be
+left behind.
+
+Usage: python benchmarks/bench_pdf_concurrency.py [--passes 64] [--workers 16]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gate_pass_pdf import create_gate_pass_pdf, signature_image_info  # noqa: E402
+from signatures import SignatureBlobStore  # noqa: E402
+
+SIGNATURE_FIELDS = ('certified_signature', 'authorized_signature', 'received_signature')
+
+
+def random_signature_png(rng):
+    image = Image.new('L', (400, 120), 255)
+    draw = ImageDraw.Draw(image)
+    points = [(rng.uniform(10, 390), rng.uniform(10, 110)) for _ in range(12)]
+    draw.line(points, fill=0, width=4)
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def make_pass(n, store, rng):
+    return {
+        'reference': f"GPTEST{n:05d}",
+        'requested_by': f"Executive {n}",
+        'send_to': "Alumex Warehouse, Makola",
+        'purpose': "Concurrency check",
+        'return_date': "",
+        'dispatch_type': "Returnable",
+        'vehicle_number': f"WP-{n:04d}",
+        'items': [{'Quantity': str(n), 'Description': f"Item {n}", 'Total Value': "100", 'Invoice No': f"INV{n}"}],
+        'certified_signature': store.put(random_signature_png(rng)),
+        'authorized_signature': store.put(random_signature_png(rng)),
+        'received_signature': store.put(random_signature_png(rng)),
+    }
+
+
+def render(gate_pass, store):
+    pdf = create_gate_pass_pdf(gate_pass, store)
+    # Uncompressed page streams so the reference text can be found in the output
+    pdf.set_compression(False)
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--passes', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--store', default=os.path.join(os.getcwd(), 'bench_signatures.db'))
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    store = SignatureBlobStore(args.store)
+    passes = [make_pass(n, store, rng) for n in range(args.passes)]
+    files_before = set(os.listdir('.'))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        documents = list(pool.map(lambda gate_pass: render(gate_pass, store), passes))
+    elapsed = time.perf_counter() - start
+
+    # Every reference line and signature image stream, with the pass it belongs to
+    markers = []
+    for gate_pass in passes:
+        markers.append((gate_pass['reference'], "reference",
+                        f"Reference: {gate_pass['reference']}".encode('latin-1')))
+        for field in SIGNATURE_FIELDS:
+            markers.append((gate_pass['reference'], field,
+                            signature_image_info(store.png(gate_pass[field]))['data']))
+
+    # Each document must carry all of its own markers and none of any other pass's
+    failures = []
+    for gate_pass, document in zip(passes, documents):
+        for owner, what, marker in markers:
+            found = marker in document
+            if owner == gate_pass['reference'] and not found:
+                failures.append(f"{gate_pass['reference']}: {what} missing")
+            elif owner != gate_pass['reference'] and found:
+                failures.append(f"{gate_pass['reference']}: contains the {what} of {owner}")
+    if len(set(documents)) != len(documents):
+        failures.append("duplicate documents rendered")
+    stray = [name for name in set(os.listdir('.')) - files_before if name.startswith('temp_sig_')]
+    if stray:
+        failures.append(f"temp files left behind: {stray}")
+
+    print(f"rendered {len(documents)} PDFs on {args.workers} threads in {elapsed:.2f}s "
+          f"({len(documents) / elapsed:.1f} PDFs/s)")
+    if failures:
+        print("FAILED:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"OK: every PDF is distinct and carries only its own reference and signatures "
+          f"(checked against all {len(markers)} references and image streams)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Script runs and Sheets calls for one completed sign-off, driven through Streamlit's AppTest.
+
+Opens the "Sign Existing Gate Pass" flow on a pending pass held by the
+in-process fake in fake_sheets.py: enter the reference, draw --strokes
+strokes on each of the two canvases, then submit. Canvas strokes are
+played back by replacing st_canvas, since AppTest can't draw on a custom
+component (the whole streamlit_drawable_canvas module is stood in for,
+so the real one needn't load). The [storage] backend is "sheets", so every storage call is a
+counted Sheets request.
+
+AppTest reruns the whole script on every interaction (it has no
+fragment-scoped reruns), so "script runs" counts every interaction as a
+full rerun, plus the reruns the app asks for itself with st.rerun. In a
+browser, an interaction with a widget inside an st.fragment reruns only
+that fragment, so these counts are an upper bound for fragment-based code.
+
+--app points at the directory holding app.py, so an older checkout can be
+measured the same way (git worktree add /tmp/before <commit>).
+
+Usage: python benchmarks/bench_sign_off.py [--app .] [--strokes 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from types import ModuleType, SimpleNamespace
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CANVAS_WIDTH, CANVAS_HEIGHT = 400, 120
+CANVASES = ('authorized_canvas', 'received_canvas')
+SUBMIT_LABEL = "✅ Submit All Signatures"
+
+
+def canvas_image(strokes, seed):
+    """RGBA canvas array with ``strokes`` short random strokes, like st_canvas returns."""
+    rng = np.random.default_rng(seed)
+    image = Image.new('RGBA', (CANVAS_WIDTH, CANVAS_HEIGHT), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for _ in range(strokes):
+        points = np.cumsum(rng.uniform(-6, 6, size=(30, 2)), axis=0) + (rng.uniform(60, 340), 60)
+        draw.line([tuple(point) for point in points], fill=(0, 0, 0, 255), width=4)
+    return np.asarray(image)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default=os.path.dirname(BENCH_DIR), help="directory holding app.py")
+    parser.add_argument('--strokes', type=int, default=3, help="strokes drawn on each canvas")
+    args = parser.parse_args()
+    app_dir = os.path.abspath(args.app)
+
+    # fake_sheets comes from this checkout; everything the app imports comes from --app
+    sys.path.insert(0, BENCH_DIR)
+    from fake_sheets import FakeClient
+    sys.path.insert(0, app_dir)
+
+    import gspread
+    import streamlit as st
+    from google.oauth2.service_account import Credentials
+    from streamlit.testing.v1 import AppTest
+
+    from references import generate_reference
+    from storage import HEADERS, SPREADSHEET_NAME, _gate_pass_to_row
+
+    client = FakeClient()
+    reference = generate_reference()
+    client.create(SPREADSHEET_NAME).sheet1.load([HEADERS, _gate_pass_to_row({
+        'reference': reference, 'requested_by': "Executive 1", 'send_to': "Site 1, Colombo",
+        'purpose': "Project shipment", 'return_date': "", 'dispatch_type': "Cash Sale",
+        'vehicle_number': "WP-1234", 'items': [{'Quantity': "1", 'Description': "Aluminium profile",
+                                                'Total Value': "100.00", 'Invoice No': "INV1"}],
+        'certified_signature': "", 'status': 'pending', 'created_date': "2026-01-01T00:00:00",
+    })])
+    gspread.authorize = lambda credentials, **kwargs: client
+    Credentials.from_service_account_info = lambda info, **kwargs: None
+
+    drawn = dict.fromkeys(CANVASES, 0)
+
+    def fake_canvas(key, **kwargs):
+        strokes = drawn.get(key, 0)
+        return SimpleNamespace(image_data=canvas_image(strokes, seed=len(key)) if strokes else None)
+
+    sys.modules['streamlit_drawable_canvas'] = ModuleType('streamlit_drawable_canvas')
+    sys.modules['streamlit_drawable_canvas'].st_canvas = fake_canvas
+
+    # set_page_config runs once at the top of every full script run
+    script_runs = [0]
+    set_page_config = st.set_page_config
+
+    def counting_set_page_config(*config_args, **config_kwargs):
+        script_runs[0] += 1
+        return set_page_config(*config_args, **config_kwargs)
+
+    st.set_page_config = counting_set_page_config
+
+    steps = []
+
+    def step(name, interactions, run):
+        runs_before, calls_before = script_runs[0], client.backend.total_calls()
+        run()
+        if app.exception:
+            raise RuntimeError(f"{name}: the script raised {app.exception[0].message}")
+        steps.append((name, interactions, script_runs[0] - runs_before, client.backend.total_calls() - calls_before))
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = AppTest.from_file(os.path.join(app_dir, 'app.py'), default_timeout=120)
+        app.secrets['gcp_service_account'] = {'client_email': "bench@example.com"}
+        app.secrets['storage'] = {
+            'backend': 'sheets',
+            'sqlite_path': os.path.join(directory, 'gate_passes.db'),
+            'journal_path': os.path.join(directory, 'offline_journal.jsonl'),
+            'signature_store_path': os.path.join(directory, 'signatures.db'),
+        }
+
+        step('open', 0, app.run)
+        step('enter reference', 1,
+             lambda: next(widget for widget in app.text_input
+                          if widget.label == "Enter Reference Number").input(reference).run())
+
+        def draw(key):
+            drawn[key] += 1
+            app.run()
+
+        for key in CANVASES:
+            for _ in range(args.strokes):
+                step(f"stroke on {key}", 1, lambda: draw(key))
+        step('submit', 1, lambda: next(button for button in app.button if button.label == SUBMIT_LABEL).click().run())
+
+        completed = any("submitted successfully" in element.value for element in app.success)
+    status = client.open(SPREADSHEET_NAME).sheet1.get_all_records()[0]['Status']
+
+    for name, interactions, runs, calls in steps:
+        print(f"{name:<28} script runs {runs:>2}  Sheets calls {calls:>3}")
+    sign_off = steps[1:]
+    print(f"sign-off (after the first page): {sum(step[1] for step in sign_off)} interactions, "
+          f"{sum(step[2] for step in sign_off)} script runs, {sum(step[3] for step in sign_off)} Sheets calls")
+    print(f"completed: {completed}, sheet status: {status}")
+    if not completed or status != 'completed':
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Bytes-per-signature and encode time: legacy full-canvas PNG vs encode_signature.
+
+Usage: python benchmarks/bench_signatures.py [--count 200] [--bits 1]
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from signatures import encode_signature  # noqa: E402
+
+CANVAS_WIDTH, CANVAS_HEIGHT = 400, 120
+
+
+# Random smooth strokes on a white 400x120 RGBA canvas, like st_canvas returns
+def synthetic_signature(rng):
+    image = Image.new('RGBA', (CANVAS_WIDTH, CANVAS_HEIGHT), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    x = rng.uniform(20, 80)
+    for _ in range(rng.integers(2, 5)):
+        steps = rng.integers(20, 60)
+        xs = x + np.cumsum(rng.uniform(0, 6, steps))
+        ys = CANVAS_HEIGHT / 2 + np.cumsum(rng.normal(0, 4, steps)).clip(-45, 45)
+        draw.line(list(zip(xs.tolist(), ys.tolist())), fill=(0, 0, 0, 255), width=4, joint='curve')
+        x = float(xs[-1]) + rng.uniform(5, 20)
+    return np.asarray(image)
+
+
+# What app.py stored before: the full RGB canvas as a default PNG
+def legacy_encode(image_data):
+    pil_img = Image.fromarray((image_data[:, :, :3]).astype('uint8'))
+    buffered = io.BytesIO()
+    pil_img.save(buffered, format="PNG")
+    img_str = base64.b64encode(buffered.getvalue()).decode()
+    return f"data:image/png;base64,{img_str}"
+
+
+def measure(encode, canvases):
+    sizes = []
+    start = time.perf_counter()
+    for canvas in canvases:
+        sizes.append(len(encode(canvas)))
+    elapsed = time.perf_counter() - start
+    return sum(sizes) / len(sizes), max(sizes), elapsed / len(canvases) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--bits', type=int, default=1, choices=[1, 2, 4])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    canvases = [synthetic_signature(rng) for _ in range(args.count)]
+
+    legacy_mean, legacy_max, legacy_ms = measure(legacy_encode, canvases)
+    compact_mean, compact_max, compact_ms = measure(
+        lambda canvas: encode_signature(canvas, bits=args.bits), canvases
+    )
+
+    print(f"signatures: {args.count} ({CANVAS_WIDTH}x{CANVAS_HEIGHT} RGBA), bits={args.bits}")
+    print(f"{'encoding':<10} {'mean chars':>11} {'max chars':>10} {'ms/sig':>8}")
+    print(f"{'legacy':<10} {legacy_mean:>11.0f} {legacy_max:>10} {legacy_ms:>8.2f}")
+    print(f"{'compact':<10} {compact_mean:>11.0f} {compact_max:>10} {compact_ms:>8.2f}")
+    print(f"reduction: {legacy_mean / compact_mean:.1f}x smaller "
+          f"({100 * (1 - compact_mean / legacy_mean):.1f}% fewer bytes per signature)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Latency and API-call benchmark for the storage and PDF hot paths, without a Google account.
+
+Runs submit (save_gate_pass), lookup (get_gate_pass), sign-off
+(update_signatures) and PDF render against a sheet of 1k, 10k and 100k
+pre-loaded passes held by the in-process fake in fake_sheets.py, for both
+storage backends. Signatures are real encoded canvas PNGs in a blob store.
+For the SQLite backend, "sync" is the write-behind pass that mirrors the
+run's writes to the sheet. "pdf_cached" is measured after every document
+has been rendered once, so it times cache hits only. The offline journal
+is a temporary file per run; a run whose writes fell back to it fails.
+
+Results are written as JSON to --output; pass a previous file as
+--compare to flag latency and API-call regressions (exit status 1).
+
+Usage: python benchmarks/bench_storage.py [--rows 1000 10000 100000] [--samples 30]
+       [--backends sheets sqlite] [--latency 0.0] [--output bench_output.txt]
+       [--compare old_bench_output.txt]
+
+The "pdf_*" rows (sheets backend only) need fpdf; with --backends sqlite the
+PDF module is never imported.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_signatures import synthetic_signature  # noqa: E402
+import storage  # noqa: E402
+from fake_sheets import FakeClient  # noqa: E402
+from journal import OfflineJournal  # noqa: E402
+from references import generate_references  # noqa: E402
+from sheets_api import SheetsAPI  # noqa: E402
+from signatures import SignatureBlobStore, encode_signature_png  # noqa: E402
+from storage import (HEADERS, SPREADSHEET_NAME, SheetsBackend, SheetsConnection, SheetsReplicator,  # noqa: E402
+                     SQLiteBackend, _gate_pass_to_row, get_gate_pass, save_gate_pass, update_signatures)
+from validation import DISPATCH_TYPES  # noqa: E402
+
+# Distinct signature images; rows reuse them, as repeat signers do
+SIGNATURE_POOL = 64
+
+
+def synthetic_pass(reference, rng, signatures, completed=False):
+    gate_pass = {
+        'reference': reference,
+        'requested_by': f"Executive {rng.randint(1, 40)}",
+        'send_to': f"Site {rng.randint(1, 300)}, Colombo",
+        'purpose': "Project shipment",
+        'return_date': "",
+        'dispatch_type': rng.choice(DISPATCH_TYPES),
+        'vehicle_number': f"WP-{rng.randint(1000, 9999)}",
+        'items': [
+            {'Quantity': str(rng.randint(1, 50)), 'Description': f"Aluminium profile {rng.randint(1, 500)}",
+             'Total Value': f"{rng.uniform(100, 50000):.2f}", 'Invoice No': f"INV{rng.randint(1, 99999)}"}
+            for _ in range(rng.randint(1, 6))
+        ],
+        'certified_signature': rng.choice(signatures),
+        'status': 'pending',
+    }
+    if completed:
+        gate_pass.update(authorized_signature=rng.choice(signatures), received_signature=rng.choice(signatures),
+                         status='completed')
+    return gate_pass
+
+
+def timed(samples, operation):
+    durations = []
+    for sample in samples:
+        start = time.perf_counter()
+        operation(sample)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(backend, rows, op, durations, api_calls):
+    durations = sorted(durations)
+    return {
+        'backend': backend,
+        'rows': rows,
+        'op': op,
+        'samples': len(durations),
+        'p50_ms': round(statistics.median(durations) * 1000, 3),
+        'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 3),
+        'mean_ms': round(statistics.fmean(durations) * 1000, 3),
+        'api_calls_per_op': round(api_calls / len(durations), 2),
+    }
+
+
+def run_backend(kind, rows, args, signatures, signature_store, directory):
+    rng = random.Random(rows)
+    client = FakeClient(latency=args.latency)
+    spreadsheet = client.create(SPREADSHEET_NAME)
+    existing = [synthetic_pass(reference, rng, signatures, completed=rng.random() < 0.5)
+                for reference in generate_references(rows)]
+    spreadsheet.sheet1.load([HEADERS] + [_gate_pass_to_row(gate_pass) for gate_pass in existing])
+
+    connection = SheetsConnection({}, api=SheetsAPI(requests_per_minute=10 ** 9, burst=10 ** 9), client=client)
+    if kind == 'sheets':
+        store = SheetsBackend(connection)
+    else:
+        store = SQLiteBackend(os.path.join(directory, f"bench_{rows}.db"), fallback=SheetsBackend(connection))
+        store.save_many(existing)
+        store.mark_synced([(gate_pass['reference'], 1) for gate_pass in existing])
+        # Not started: the benchmark runs its sync passes explicitly
+        store.replicator = SheetsReplicator(store, connection)
+    connection.worksheet()
+
+    # The storage functions fall back to the journal on any write failure; keep that out of
+    # the app's real journal, and treat any use of it as a failed run
+    journal = OfflineJournal(os.path.join(directory, f"journal_{kind}_{rows}.jsonl"))
+    storage.get_offline_journal = lambda: journal
+
+    results = []
+
+    def measure(op, samples, operation):
+        before = client.backend.total_calls()
+        durations = timed(samples, operation)
+        results.append(summarize(kind, rows, op, durations, client.backend.total_calls() - before))
+
+    pending = [gate_pass['reference'] for gate_pass in existing if gate_pass['status'] == 'pending']
+    connection.reference_index.invalidate()
+    measure('lookup_cold', [rng.choice(pending)], lambda reference: get_gate_pass(store, reference))
+    measure('lookup', [rng.choice(existing)['reference'] for _ in range(args.samples)],
+            lambda reference: get_gate_pass(store, reference))
+
+    new_passes = [synthetic_pass(reference, rng, signatures) for reference in generate_references(args.samples)]
+    measure('submit', new_passes, lambda gate_pass: save_gate_pass(store, gate_pass))
+
+    def sign_off(reference):
+        if not update_signatures(store, reference, '', rng.choice(signatures), rng.choice(signatures), "WP-1234"):
+            raise RuntimeError(f"sign-off failed for {reference}")
+
+    measure('sign_off', rng.sample(pending, args.samples), sign_off)
+
+    if kind == 'sqlite':
+        def sync(_):
+            while store.replicator.sync_once():
+                pass
+
+        measure('sync', [None], sync)
+
+    if kind == 'sheets':
+        from gate_pass_pdf import create_gate_pass_pdf, render_gate_pass_pdf
+
+        completed = [gate_pass for gate_pass in existing if gate_pass['status'] == 'completed']
+        documents = rng.sample(completed, args.samples)
+        measure('pdf_render', documents, lambda gate_pass: create_gate_pass_pdf(gate_pass, signature_store).output(dest='S'))
+        for gate_pass in documents:
+            render_gate_pass_pdf(gate_pass, signature_store)
+        measure('pdf_cached', documents, lambda gate_pass: render_gate_pass_pdf(gate_pass, signature_store))
+
+    journaled = journal.pending_count()
+    if journaled:
+        raise RuntimeError(f"{journaled} pass(es) fell back to the offline journal; the timings are not valid")
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = {(row['backend'], row['rows'], row['op']): row for row in json.load(baseline_file)['results']}
+    regressions = []
+    for row in results:
+        before = baseline.get((row['backend'], row['rows'], row['op']))
+        if before is None:
+            continue
+        if row['api_calls_per_op'] > before['api_calls_per_op']:
+            regressions.append(f"{row['backend']}/{row['rows']}/{row['op']}: API calls per op "
+                               f"{before['api_calls_per_op']} -> {row['api_calls_per_op']}")
+        if row['p50_ms'] > before['p50_ms'] * (1 + tolerance) and row['p50_ms'] - before['p50_ms'] > 1:
+            regressions.append(f"{row['backend']}/{row['rows']}/{row['op']}: p50 "
+                               f"{before['p50_ms']}ms -> {row['p50_ms']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10_000, 100_000])
+    parser.add_argument('--backends', nargs='+', default=['sheets', 'sqlite'], choices=['sheets', 'sqlite'])
+    parser.add_argument('--samples', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every fake API request")
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(BENCH_DIR), 'bench_output.txt'))
+    parser.add_argument('--compare', help="previous --output file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p50 slowdown, as a fraction")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        signature_store = SignatureBlobStore(os.path.join(directory, 'signatures.db'))
+        canvas_rng = np.random.default_rng(0)
+        signatures = [signature_store.put(encode_signature_png(synthetic_signature(canvas_rng)))
+                      for _ in range(SIGNATURE_POOL)]
+
+        for rows in args.rows:
+            for kind in args.backends:
+                for row in run_backend(kind, rows, args, signatures, signature_store, directory):
+                    results.append(row)
+                    print(f"{row['backend']:>6} {row['rows']:>7,} {row['op']:<12} p50 {row['p50_ms']:>9.3f}ms  "
+                          f"p95 {row['p95_ms']:>9.3f}ms  API calls/op {row['api_calls_per_op']:>6}")
+
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump({'latency': args.latency, 'samples': args.samples, 'results': results}, output, indent=1)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Cold-start guard: time to first render of app.py in a fresh interpreter.
+
+Each sample starts a new Python process (nothing imported, no warm caches),
+loads Streamlit the way the server already has it loaded, then times the
+script's first run with Streamlit's AppTest. Storage goes to a temporary
+directory and no Google credentials are configured, like a fresh container.
+
+Both entry pages are timed: the main page and the gate-check page a
+scanned QR code opens (?ref=). The check fails (exit status 1) when either
+page's median first run exceeds --target seconds, when the header is
+missing, or when a module that only submit, sign-off or export needs
+(FPDF, qrcode, gspread, google-auth, openpyxl) was imported to draw it.
+The gate-check page draws no canvas, so PIL must not load there either.
+pandas, numpy and pyarrow are expected on both pages: st.data_editor and
+st.dataframe send their tables as Arrow.
+
+Usage: python benchmarks/check_cold_start.py [--samples 3] [--target 2.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(os.path.dirname(BENCH_DIR), 'app.py')
+
+# Seconds from the start of the first script run to the finished first page.
+# Baseline (Python 3.11, Streamlit 1.65, empty SQLite storage), medians of 5-7 cold samples
+# over four runs: main page 0.98-1.36s, gate-check page 1.10-1.15s. The target is about
+# 1.5x the slowest median, so run-to-run noise doesn't fail the check but a regression does.
+COLD_START_TARGET = 2.0
+
+# Only submit, sign-off, export or a live Sheets connection may load these
+DEFERRED_MODULES = ['fpdf', 'qrcode', 'gspread', 'google.oauth2', 'openpyxl']
+
+# Page name -> (query parameters, modules it must not load)
+PAGES = {
+    'main': ({}, DEFERRED_MODULES),
+    'gate check': ({'ref': 'GP2J2KSHT3007QS'}, DEFERRED_MODULES + ['PIL']),
+}
+
+HEADER = "Advice Dispatch Gate Pass"
+
+
+def first_run(page):
+    """One cold first run of ``page``, in this (fresh) process; returns the measurements as a dict."""
+    from streamlit.testing.v1 import AppTest
+
+    query, deferred = PAGES[page]
+    with tempfile.TemporaryDirectory() as directory:
+        app = AppTest.from_file(APP_PATH, default_timeout=120)
+        app.query_params.update(query)
+        app.secrets['storage'] = {
+            'sqlite_path': os.path.join(directory, 'gate_passes.db'),
+            'journal_path': os.path.join(directory, 'offline_journal.jsonl'),
+            'signature_store_path': os.path.join(directory, 'signatures.db'),
+        }
+        already_loaded = set(sys.modules)
+        start = time.perf_counter()
+        app.run()
+        seconds = time.perf_counter() - start
+
+        return {
+            'seconds': seconds,
+            'header': any(HEADER in element.value for element in app.markdown),
+            'exceptions': [exception.message for exception in app.exception],
+            'deferred_loaded': sorted(
+                module for module in deferred
+                if module in sys.modules and module not in already_loaded
+            ),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=3)
+    parser.add_argument('--target', type=float, default=COLD_START_TARGET, help="maximum median first run, seconds")
+    parser.add_argument('--child', choices=list(PAGES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(first_run(args.child)))
+        return
+
+    failures = []
+    for page in PAGES:
+        runs = []
+        for sample in range(args.samples):
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', page],
+                                   capture_output=True, text=True, check=True)
+            run = json.loads(child.stdout.strip().splitlines()[-1])
+            runs.append(run)
+            print(f"{page} sample {sample + 1}: first render {run['seconds']:.2f}s"
+                  + (f", loaded {', '.join(run['deferred_loaded'])}" if run['deferred_loaded'] else ""))
+
+        median = statistics.median(run['seconds'] for run in runs)
+        if median > args.target:
+            failures.append(f"{page}: median first render {median:.2f}s is over the {args.target:.2f}s target")
+        for run in runs:
+            if not run['header']:
+                failures.append(f"{page}: the header was not rendered")
+            failures += [f"{page}: the script raised: {message}" for message in run['exceptions']]
+            failures += [f"{page}: {module} was imported before it was needed" for module in run['deferred_loaded']]
+        print(f"{page}: median first render {median:.2f}s (target {args.target:.2f}s)")
+
+    for failure in dict.fromkeys(failures):
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""In-process stand-in for the part of gspread the app uses.
+
+``FakeClient`` / ``FakeSpreadsheet`` / ``FakeWorksheet`` keep rows in
+memory and implement the calls storage.py makes, with the response shapes
+gspread returns (trimmed trailing cells, ``updates.updatedRange`` from
+appends, ``deleteDimension`` batch updates). Every call counts as one API
+request: it can be delayed by ``latency`` seconds and fails with a real
+``gspread.exceptions.APIError`` (HTTP 429) once more than
+``requests_per_minute`` requests land in a minute, or at random with
+``error_rate``.
+
+Usage:
+    client = FakeClient(latency=0.05, requests_per_minute=60)
+    connection = SheetsConnection({}, client=client)
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+
+import gspread
+
+_A1 = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def _column_letters(number):
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _parse_range(a1):
+    """``(first_col, first_row, last_col, last_row)``, 1-based; open ends are None."""
+    match = _A1.match(a1.split('!')[-1])
+    if match is None:
+        raise ValueError(f"Unsupported range: {a1}")
+    start_col, start_row, end_col, end_row = match.groups()
+    if end_col is None and end_row is None:
+        end_col, end_row = start_col, start_row
+    return (
+        _column_number(start_col) if start_col else 1,
+        int(start_row) if start_row else 1,
+        _column_number(end_col) if end_col else None,
+        int(end_row) if end_row else None,
+    )
+
+
+def _trimmed(values):
+    values = list(values)
+    while values and values[-1] == '':
+        values.pop()
+    return values
+
+
+class _Response:
+    """Enough of a requests.Response for gspread's APIError."""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+        self._payload = {'error': {'code': status_code, 'message': message, 'status': 'RESOURCE_EXHAUSTED'}}
+
+    def json(self):
+        return self._payload
+
+
+class FakeBackend:
+    """Latency, quota and call accounting shared by every object of one fake client."""
+
+    def __init__(self, latency=0.0, jitter=0.0, requests_per_minute=None, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self.rejected = 0
+        self._random = random.Random(seed)
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def request(self, method):
+        with self._lock:
+            self.calls[method] += 1
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            over_quota = self.requests_per_minute is not None and len(self._recent) >= self.requests_per_minute
+            if not over_quota:
+                self._recent.append(now)
+            failed = over_quota or self._random.random() < self.error_rate
+            if failed:
+                self.rejected += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise gspread.exceptions.APIError(_Response(429, "Quota exceeded for quota metric 'Read requests'"))
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+
+class FakeWorksheet:
+    _ids = iter(range(1, 1_000_000))
+
+    def __init__(self, backend, title, rows=None):
+        self._backend = backend
+        self.id = next(self._ids)
+        self.title = title
+        self.rows = rows if rows is not None else []
+        self._lock = threading.Lock()
+
+    # Bulk-load rows without counting requests, for setting up a benchmark
+    def load(self, rows):
+        with self._lock:
+            self.rows.extend(list(row) for row in rows)
+
+    def _updated_range(self, first, last, width):
+        return {'updates': {'updatedRange': f"'{self.title}'!A{first}:{_column_letters(width)}{last}"}}
+
+    def append_row(self, values, **kwargs):
+        self._backend.request('append_row')
+        with self._lock:
+            self.rows.append([str(value) for value in values])
+            return self._updated_range(len(self.rows), len(self.rows), len(values))
+
+    def append_rows(self, values, **kwargs):
+        self._backend.request('append_rows')
+        with self._lock:
+            first = len(self.rows) + 1
+            self.rows.extend([str(value) for value in row] for row in values)
+            return self._updated_range(first, len(self.rows), max(len(row) for row in values))
+
+    def col_values(self, col, **kwargs):
+        self._backend.request('col_values')
+        with self._lock:
+            return _trimmed(row[col - 1] if col - 1 < len(row) else '' for row in self.rows)
+
+    def row_values(self, row, **kwargs):
+        self._backend.request('row_values')
+        with self._lock:
+            return _trimmed(self.rows[row - 1]) if row - 1 < len(self.rows) else []
+
+    def _read(self, a1):
+        first_col, first_row, last_col, last_row = _parse_range(a1)
+        rows = self.rows[first_row - 1:last_row]
+        values = [_trimmed(row[first_col - 1:last_col]) for row in rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def get(self, range_name=None, **kwargs):
+        self._backend.request('get')
+        with self._lock:
+            return self._read(range_name) if range_name else [_trimmed(row) for row in self.rows]
+
+    def batch_get(self, ranges, **kwargs):
+        self._backend.request('batch_get')
+        with self._lock:
+            return [self._read(a1) for a1 in ranges]
+
+    def get_all_values(self, **kwargs):
+        self._backend.request('get_all_values')
+        with self._lock:
+            return [list(row) for row in self.rows]
+
+    def get_all_records(self, **kwargs):
+        self._backend.request('get_all_records')
+        with self._lock:
+            if not self.rows:
+                return []
+            headers = self.rows[0]
+            return [dict(zip(headers, row + [''] * (len(headers) - len(row)))) for row in self.rows[1:]]
+
+    def batch_update(self, data, **kwargs):
+        self._backend.request('batch_update')
+        with self._lock:
+            for update in data:
+                first_col, first_row, last_col, last_row = _parse_range(update['range'])
+                for offset, values in enumerate(update['values']):
+                    index = first_row - 1 + offset
+                    while len(self.rows) <= index:
+                        self.rows.append([])
+                    row = self.rows[index]
+                    needed = first_col - 1 + len(values)
+                    row.extend([''] * (needed - len(row)))
+                    row[first_col - 1:needed] = [str(value) for value in values]
+
+    def _delete_rows(self, start_index, end_index):
+        with self._lock:
+            del self.rows[start_index:end_index]
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend, title):
+        self._backend = backend
+        self.title = title
+        self._worksheets = [FakeWorksheet(backend, "Sheet1")]
+
+    @property
+    def sheet1(self):
+        self._backend.request('fetch_sheet_metadata')
+        return self._worksheets[0]
+
+    def worksheets(self):
+        self._backend.request('fetch_sheet_metadata')
+        return list(self._worksheets)
+
+    def add_worksheet(self, title, rows, cols, **kwargs):
+        self._backend.request('add_worksheet')
+        worksheet = FakeWorksheet(self._backend, title)
+        self._worksheets.append(worksheet)
+        return worksheet
+
+    def share(self, email, perm_type, role, **kwargs):
+        self._backend.request('share')
+
+    def batch_update(self, body):
+        self._backend.request('spreadsheet_batch_update')
+        for request in body['requests']:
+            target = request['deleteDimension']['range']
+            worksheet = next(sheet for sheet in self._worksheets if sheet.id == target['sheetId'])
+            worksheet._delete_rows(target['startIndex'], target['endIndex'])
+
+
+class FakeClient:
+    """Stand-in for an authorized ``gspread.Client``; keyword arguments configure FakeBackend."""
+
+    def __init__(self, **backend_options):
+        self.backend = FakeBackend(**backend_options)
+        self._spreadsheets = {}
+
+    def open(self, title):
+        self.backend.request('open')
+        if title not in self._spreadsheets:
+            raise gspread.SpreadsheetNotFound(title)
+        return self._spreadsheets[title]
+
+    def create(self, title, **kwargs):
+        self.backend.request('create')
+        spreadsheet = self._spreadsheets[title] = FakeSpreadsheet(self.backend, title)
+        return spreadsheet
@@ -0,0 +1,137 @@
+import io
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+EXPORT_FORMATS = {
+    'zip': ("ZIP of PDFs", "application/zip"),
+    'pdf': ("Single merged PDF", "application/pdf"),
+}
+
+# Passes per merged PDF. pypdf keeps every page of the merged document in memory until
+# it is written, so larger ranges have to be exported as a ZIP, which streams to disk.
+MAX_MERGED_PASSES = 500
+
+# Gate pass keys holding a signature (an image reference or an inline data URI)
+SIGNATURE_FIELDS = ('certified_signature', 'authorized_signature', 'received_signature')
+
+# Signature store and gate-check settings of the current worker process, set once by _init_worker
+_worker_signature_store = None
+_worker_gate_check = None
+
+
+def _init_worker(signature_store, gate_check=None):
+    global _worker_signature_store, _worker_gate_check
+    _worker_signature_store = signature_store
+    _worker_gate_check = gate_check
+
+
+def _render_chunk(gate_passes):
+    # Imported here so the app can offer the export without loading FPDF up front
+    from gate_pass_pdf import create_gate_pass_pdf
+
+    rendered = []
+    for gate_pass in gate_passes:
+        pdf = create_gate_pass_pdf(gate_pass, _worker_signature_store, _worker_gate_check)
+        rendered.append((gate_pass['reference'], pdf.output(dest='S').encode('latin-1')))
+    return rendered
+
+
+# Workers only open the signature store's local file, so images only the shared store
+# has are copied into it before their chunk is handed over
+def _localized(chunks, signature_store):
+    for chunk in chunks:
+        signature_store.localize([gate_pass.get(field, '') for gate_pass in chunk for field in SIGNATURE_FIELDS])
+        yield chunk
+
+
+def _chunks(gate_passes, size):
+    chunk = []
+    for gate_pass in gate_passes:
+        chunk.append(gate_pass)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_many(gate_passes, signature_store=None, workers=None, chunksize=8, gate_check=None):
+    """Yield ``(reference, pdf_bytes)`` in input order, rendered on a process pool.
+
+    At most ``2 * workers`` chunks are in flight, so memory stays bounded by
+    the window rather than by the number of passes.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(gate_passes, chunksize)
+
+    if workers == 1:
+        _init_worker(signature_store, gate_check)
+        for chunk in chunks:
+            yield from _render_chunk(chunk)
+        return
+
+    if signature_store is not None:
+        chunks = _localized(chunks, signature_store)
+
+    # Streamlit serves sessions from threads, so fork is not safe here
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(signature_store, gate_check)) as pool:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.submit(_render_chunk, chunk))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def export_gate_passes(gate_passes, output, export_format='zip', signature_store=None,
+                       workers=None, progress=None, gate_check=None, total=None):
+    """Render every pass and stream it into ``output`` (a path or binary file object).
+
+    ``gate_passes`` may be any iterable (e.g. ``storage.iter_gate_passes``);
+    it is consumed as rendering proceeds. ``export_format`` is ``'zip'`` (one
+    PDF per pass, written as each one arrives) or ``'pdf'`` (one merged
+    document of at most ``MAX_MERGED_PASSES`` passes, needs pypdf; a longer
+    input raises ``ValueError``). ``progress(done, total)`` is called after
+    every pass, with ``total`` None when neither it nor ``len(gate_passes)``
+    is known. Returns the number of passes exported.
+    """
+    if total is None and hasattr(gate_passes, '__len__'):
+        total = len(gate_passes)
+    if export_format == 'pdf' and total is not None and total > MAX_MERGED_PASSES:
+        raise ValueError(f"A merged PDF holds at most {MAX_MERGED_PASSES} gate passes; "
+                         f"export these {total} as a ZIP")
+    rendered = render_many(gate_passes, signature_store, workers, gate_check=gate_check)
+    done = 0
+
+    if export_format == 'zip':
+        # PDFs are already compressed; storing them keeps the archive write cheap
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for done, (reference, document) in enumerate(rendered, 1):
+                archive.writestr(f"gate_pass_{reference}.pdf", document)
+                if progress is not None:
+                    progress(done, total)
+
+    elif export_format == 'pdf':
+        from pypdf import PdfReader, PdfWriter
+
+        writer = PdfWriter()
+        for done, (reference, document) in enumerate(rendered, 1):
+            if done > MAX_MERGED_PASSES:
+                rendered.close()
+                raise ValueError(f"A merged PDF holds at most {MAX_MERGED_PASSES} gate passes; "
+                                 f"export this range as a ZIP")
+            writer.append(PdfReader(io.BytesIO(document)), outline_item=reference)
+            if progress is not None:
+                progress(done, total)
+        writer.write(output)
+
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+    return done
@@ -0,0 +1,146 @@
+import re
+import time
+
+import pandas as pd
+
+from references import generate_references
+from storage import save_gate_passes
+from validation import DISPATCH_TYPES, ITEM_COLUMNS, non_empty_items, validate_gate_pass
+
+# Pass-level columns of an import file and the gate pass field each one fills
+PASS_COLUMNS = {
+    'Requested By': 'requested_by',
+    'Send To': 'send_to',
+    'Purpose': 'purpose',
+    'Return Date': 'return_date',
+    'Dispatch Type': 'dispatch_type',
+    'Vehicle Number': 'vehicle_number',
+}
+
+# Rows sharing a Pass No are the items of one pass, whose details come from its first row;
+# rows without a Pass No are passes of their own
+GROUP_COLUMN = 'Pass No'
+
+IMPORT_COLUMNS = [GROUP_COLUMN] + list(PASS_COLUMNS) + ITEM_COLUMNS
+
+IMPORT_FORMATS = ['csv', 'xlsx']
+
+
+def _column_key(name):
+    return re.sub(r'[\s_]+', ' ', str(name)).strip().lower()
+
+
+_COLUMN_NAMES = {_column_key(column): column for column in IMPORT_COLUMNS}
+
+
+def import_template():
+    """CSV bytes of an empty import file with every column."""
+    return pd.DataFrame(columns=IMPORT_COLUMNS).to_csv(index=False).encode('utf-8')
+
+
+def read_import_file(file, filename):
+    """Every cell of an uploaded CSV or XLSX file as text, with column names normalized."""
+    if filename.lower().endswith('.xlsx'):
+        frame = pd.read_excel(file, dtype=str, keep_default_na=False)
+    else:
+        frame = pd.read_csv(file, dtype=str, keep_default_na=False)
+    return frame.rename(columns=lambda name: _COLUMN_NAMES.get(_column_key(name), name))
+
+
+def _return_date(value):
+    if not value:
+        return "", None
+    parsed = pd.to_datetime(value, errors='coerce')
+    if pd.isna(parsed):
+        return value, f"Return Date '{value}' is not a date"
+    return parsed.strftime("%Y-%m-%d"), None
+
+
+def _dispatch_type(value):
+    for dispatch_type in DISPATCH_TYPES:
+        if value.lower() == dispatch_type.lower():
+            return dispatch_type
+    return value
+
+
+def parse_import(frame):
+    """Group an import frame into gate passes and validate each one with the submit rules.
+
+    Returns ``(passes, errors)``: ``passes`` is ``[(row_number, gate_pass)]``
+    for the valid passes and ``errors`` is ``[(row_number, message)]``, with
+    row numbers as the spreadsheet shows them (the header is row 1).
+    """
+    missing = [column for column in list(PASS_COLUMNS) + ['Description'] if column not in frame.columns]
+    if missing:
+        return [], [(1, f"Missing column(s): {', '.join(missing)}")]
+
+    frame = frame.reindex(columns=IMPORT_COLUMNS, fill_value='')
+    records = frame.to_dict('records')
+    groups = {}
+    for position, record in enumerate(records):
+        record = {column: str(value).strip() for column, value in record.items()}
+        key = record[GROUP_COLUMN] or (position,)
+        groups.setdefault(key, []).append((position + 2, record))
+
+    passes, errors = [], []
+    for rows in groups.values():
+        row_number, first = rows[0]
+        gate_pass = {field: first[column] for column, field in PASS_COLUMNS.items()}
+        gate_pass['dispatch_type'] = _dispatch_type(gate_pass['dispatch_type'])
+        gate_pass['return_date'], date_error = _return_date(gate_pass['return_date'])
+        gate_pass['items'] = non_empty_items([{column: record[column] for column in ITEM_COLUMNS}
+                                              for row, record in rows])
+
+        pass_errors = ([date_error] if date_error else []) + validate_gate_pass(gate_pass)
+        if pass_errors:
+            errors.extend((row_number, message) for message in pass_errors)
+        else:
+            passes.append((row_number, gate_pass))
+    return passes, errors
+
+
+class ImportResult:
+    """Outcome of ``import_gate_passes``, with the timings behind its throughput."""
+
+    def __init__(self, references, journaled, parse_seconds, write_seconds, rows):
+        self.references = references
+        self.journaled = journaled
+        self.parse_seconds = parse_seconds
+        self.write_seconds = write_seconds
+        self.rows = rows
+
+    @property
+    def imported(self):
+        return len(self.references)
+
+    def throughput(self):
+        total = self.parse_seconds + self.write_seconds
+        return {
+            'rows_per_second': self.rows / total if total else 0.0,
+            'passes_per_second': self.imported / self.write_seconds if self.write_seconds else 0.0,
+        }
+
+
+def import_gate_passes(store, frame, batch_size=500, progress=None):
+    """Validate ``frame`` and write its valid passes to ``store``, ``batch_size`` per write.
+
+    References are generated in one call for the whole file. Passes
+    storage can't take are journaled offline (``ImportResult.journaled``). Returns
+    ``(ImportResult, errors)``; ``ImportResult.references`` maps each
+    imported pass's first row number to its new reference.
+    """
+    started = time.perf_counter()
+    passes, errors = parse_import(frame)
+    references = generate_references(len(passes))
+    for (row_number, gate_pass), reference in zip(passes, references):
+        gate_pass['reference'] = reference
+    parsed = time.perf_counter()
+
+    journaled = save_gate_passes(store, [gate_pass for row_number, gate_pass in passes], batch_size, progress)
+    finished = time.perf_counter()
+
+    result = ImportResult(
+        {row_number: gate_pass['reference'] for row_number, gate_pass in passes},
+        journaled, parsed - started, finished - parsed, len(frame)
+    )
+    return result, errors
@@ -0,0 +1,42 @@
+import hashlib
+import hmac
+from urllib.parse import parse_qs, quote, urlsplit
+
+from references import normalize_reference
+
+# Hex characters of the HMAC printed in the QR code
+VERIFICATION_LENGTH = 12
+
+
+class GateCheck:
+    """Builds and verifies the gate-check payload printed as a QR code on each pass.
+
+    The payload is ``<base_url>?ref=<reference>&v=<code>``, where ``code``
+    is an HMAC-SHA256 of the reference under ``secret``. Scanned with a
+    phone, it opens the app straight in gate-check mode. Without a secret
+    the code is a plain hash: it still catches misreads and retyping
+    mistakes, but not forgeries.
+    """
+
+    def __init__(self, base_url="", secret=""):
+        self.base_url = base_url.rstrip('/')
+        self.secret = secret
+
+    def code(self, reference):
+        digest = hmac.new(self.secret.encode('utf-8'), reference.encode('utf-8'), hashlib.sha256)
+        return digest.hexdigest()[:VERIFICATION_LENGTH].upper()
+
+    def payload(self, reference):
+        return f"{self.base_url}/?ref={quote(reference, safe='')}&v={self.code(reference)}"
+
+    def verify(self, reference, code):
+        return hmac.compare_digest(self.code(reference), code.strip().upper())
+
+
+def parse_payload(text):
+    """``(reference, code)`` from a scanned payload or a typed reference; code is '' if absent."""
+    text = text.strip()
+    if 'ref=' not in text:
+        return normalize_reference(text), ''
+    query = parse_qs(urlsplit(text).query or text.split('?', 1)[-1])
+    return normalize_reference(query.get('ref', [''])[0]), query.get('v', [''])[0]
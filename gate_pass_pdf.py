@@ -0,0 +1,360 @@
+import datetime
+import functools
+import hashlib
+import io
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+import qrcode
+from fpdf import FPDF
+from PIL import Image
+
+from gate_check import GateCheck
+from signatures import decode_data_uri
+from tracing import tracer
+
+# Decoded signature images, keyed by the SHA-256 of their PNG bytes
+SIGNATURE_IMAGE_CACHE_SIZE = 256
+
+# Byte budget for finished PDFs kept by the rendered-PDF cache
+PDF_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Image pixels per QR module, so viewers that smooth scaled images keep the edges sharp
+QR_MODULE_PIXELS = 4
+
+# Fonts the letterhead uses, in the order it first selects them
+LETTERHEAD_FONTS = [("Arial", 'B', 18), ("Arial", 'B', 16), ("Arial", '', 12)]
+
+_image_cache = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+_letterhead = None
+_letterhead_lock = threading.Lock()
+
+
+class PDFWithFooter(FPDF):
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 9)
+        current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.cell(0, 10, f'Generated on: {current_date} | Page {self.page_no()}', 0, 0, 'C')
+
+    def memory_image(self, info, x, y, w, h):
+        """Place an image from ``signature_image_info`` without touching the filesystem.
+
+        FPDF only parses an image the first time it sees its name; registering
+        the already-decoded info under a content-hash name makes ``image()``
+        use it directly.
+        """
+        name = f"mem:{info['sha256']}"
+        if name not in self.images:
+            # FPDF drops the pixel data after writing it out, so keep the cached dict intact
+            image_info = dict(info)
+            image_info['i'] = len(self.images) + 1
+            self.images[name] = image_info
+        self.image(name, x=x, y=y, w=w, h=h)
+
+
+def signature_image_info(png):
+    """FPDF image info (Flate-compressed greyscale pixels) for PNG bytes, cached by content hash."""
+    digest = hashlib.sha256(png).hexdigest()
+    with _image_cache_lock:
+        info = _image_cache.get(digest)
+        if info is not None:
+            _image_cache.move_to_end(digest)
+            return info
+
+    # Signatures are black ink; greyscale also flattens 1-bit and palette PNGs for FPDF
+    image = Image.open(io.BytesIO(png)).convert('L')
+    info = {
+        'sha256': digest,
+        'w': image.width,
+        'h': image.height,
+        'cs': 'DeviceGray',
+        'bpc': 8,
+        'f': 'FlateDecode',
+        'data': zlib.compress(image.tobytes()),
+    }
+    with _image_cache_lock:
+        _image_cache[digest] = info
+        while len(_image_cache) > SIGNATURE_IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return info
+
+
+@functools.lru_cache(maxsize=SIGNATURE_IMAGE_CACHE_SIZE)
+def qr_image_info(payload):
+    """FPDF image info for a QR code of ``payload``, ready for ``memory_image``."""
+    code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=2)
+    code.add_data(payload)
+    code.make(fit=True)
+    rows = []
+    for modules in code.get_matrix():
+        row = b''.join(b'\x00' * QR_MODULE_PIXELS if dark else b'\xff' * QR_MODULE_PIXELS for dark in modules)
+        rows.append(row * QR_MODULE_PIXELS)
+    size = len(rows) * QR_MODULE_PIXELS
+    return {
+        'sha256': hashlib.sha256(payload.encode('utf-8')).hexdigest(),
+        'w': size,
+        'h': size,
+        'cs': 'DeviceGray',
+        'bpc': 8,
+        'f': 'FlateDecode',
+        'data': zlib.compress(b''.join(rows)),
+    }
+
+
+def _draw_letterhead(pdf):
+    pdf.set_font("Arial", 'B', 18)
+    pdf.cell(0, 10, "ADVICE DISPATCH GATE PASS", ln=True, align='C')
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(0, 8, "ALUMEX GROUP", ln=True, align='C')
+    pdf.set_font("Arial", size=12)
+    pdf.cell(0, 6, "Sapugaskanda, Makola", ln=True, align='C')
+    pdf.cell(0, 6, "Tel: 2400332,2400333,2400421", ln=True, align='C')
+
+
+def _new_page(pdf):
+    pdf.add_page()
+    pdf.set_margins(left=15, top=15, right=15)
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+
+# The letterhead is laid out once per process: its page-content operators and
+# the resulting cursor position are captured from a template document and
+# appended verbatim to every new gate pass.
+def _letterhead_stream():
+    global _letterhead
+    with _letterhead_lock:
+        if _letterhead is None:
+            template = PDFWithFooter(format='A4')
+            _new_page(template)
+            before = len(template.pages[template.page])
+            _draw_letterhead(template)
+            _letterhead = (template.pages[template.page][before:], template.get_y())
+        return _letterhead
+
+
+def _apply_letterhead(pdf):
+    stream, y = _letterhead_stream()
+    # Register the fonts in the template's order so the captured /F<n> names resolve
+    for family, style, size in LETTERHEAD_FONTS:
+        pdf.set_font(family, style, size)
+    pdf.pages[pdf.page] += stream
+    pdf.set_y(y)
+
+
+def _signature_png(signature, signature_store):
+    if signature_store is not None:
+        png = signature_store.png(signature)
+    elif signature.startswith('data:'):
+        png = decode_data_uri(signature)
+    else:
+        png = None
+    if png is None:
+        raise ValueError("signature image not available")
+    return png
+
+
+# PDF creation function
+# signature_store resolves "sha256:" signature references; inline data URIs decode without it.
+# gate_check builds the QR code payload printed in the top right corner.
+@tracer.traced('pdf.create')
+def create_gate_pass_pdf(gate_pass_data, signature_store=None, gate_check=None):
+    pdf = PDFWithFooter(format='A4')
+    _new_page(pdf)
+    
+    # Header
+    _apply_letterhead(pdf)
+    
+    # Gate-check QR code, clear of the centred letterhead
+    gate_check = gate_check or GateCheck()
+    pdf.memory_image(qr_image_info(gate_check.payload(gate_pass_data['reference'])), x=170, y=10, w=25, h=25)
+    pdf.set_font("Arial", size=7)
+    pdf.text(172, 37.5, "Scan at the gate")
+    
+    pdf.ln(8)
+    
+    # Reference Number
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 8, f"Reference: {gate_pass_data['reference']}", ln=True, align='L')
+    pdf.ln(5)
+    
+    # Basic Information
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "BASIC INFORMATION", ln=True, align='L')
+    pdf.set_font("Arial", size=11)
+    
+    info_data = [
+        ("Requested by:", gate_pass_data['requested_by']),
+        ("Send to:", gate_pass_data['send_to']),
+        ("Purpose:", gate_pass_data['purpose']),
+        ("Return Date:", gate_pass_data.get('return_date', 'Not specified')),
+        ("Dispatch Type:", gate_pass_data['dispatch_type']),
+        ("Vehicle Number:", gate_pass_data.get('vehicle_number', ''))
+    ]
+    
+    for label, value in info_data:
+        pdf.set_font("Arial", 'B', 11)
+        pdf.cell(45, 7, label, 0, 0)
+        pdf.set_font("Arial", size=11)
+        pdf.cell(0, 7, str(value), ln=True)
+    
+    pdf.ln(8)
+    
+    # Items Table
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "ITEMS DISPATCH DETAILS", ln=True, align='L')
+    pdf.ln(5)
+    
+    # Table headers
+    pdf.set_font("Arial", 'B', 11)
+    col_widths = [20, 100, 30, 35]
+    headers = ["Qty", "Description", "Value", "Invoice No"]
+    
+    for i, header in enumerate(headers):
+        pdf.cell(col_widths[i], 10, header, 1, 0, 'C')
+    pdf.ln()
+    
+    # Table rows
+    pdf.set_font("Arial", size=10)
+    for item in gate_pass_data['items']:
+        pdf.cell(col_widths[0], 8, str(item.get('Quantity', '')), 1, 0, 'C')
+        
+        desc = str(item.get('Description', ''))
+        if len(desc) > 40:
+            desc = desc[:37] + "..."
+        pdf.cell(col_widths[1], 8, desc, 1, 0, 'L')
+        
+        pdf.cell(col_widths[2], 8, str(item.get('Total Value', '')), 1, 0, 'C')
+        pdf.cell(col_widths[3], 8, str(item.get('Invoice No', '')), 1, 0, 'C')
+        pdf.ln()
+    
+    pdf.ln(12)
+    
+    # Signatures section
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "AUTHORIZATIONS & SIGNATURES", ln=True, align='C')
+    pdf.ln(8)
+    
+    # Signature boxes
+    col_width = 55
+    spacing = 10
+    start_x = 15
+    
+    signatures = [
+        ("CERTIFIED BY", "Certifying Officer", gate_pass_data.get('certified_signature')),
+        ("AUTHORIZED BY", "Authorizing Manager", gate_pass_data.get('authorized_signature')),
+        ("RECEIVED BY", "Receiving Party", gate_pass_data.get('received_signature'))
+    ]
+    
+    # Signature titles
+    pdf.set_font("Arial", 'B', 11)
+    for i, (title, label, signature) in enumerate(signatures):
+        x_position = start_x + (i * (col_width + spacing))
+        pdf.set_xy(x_position, pdf.get_y())
+        pdf.cell(col_width, 6, title, 0, 0, 'C')
+    
+    pdf.ln(8)
+    
+    # Signature boxes
+    current_y = pdf.get_y()
+    for i, (title, label, signature) in enumerate(signatures):
+        x_position = start_x + (i * (col_width + spacing))
+        pdf.rect(x_position, current_y, col_width, 25)
+        
+        if signature and signature.strip():
+            try:
+                png = _signature_png(signature, signature_store)
+                pdf.memory_image(signature_image_info(png), x=x_position + 2, y=current_y + 2, w=col_width - 4, h=21)
+            except Exception:
+                pdf.set_font("Arial", 'I', 8)
+                pdf.set_xy(x_position, current_y + 10)
+                pdf.cell(col_width, 5, "SIGNED", 0, 0, 'C')
+        else:
+            pdf.set_font("Arial", 'I', 8)
+            pdf.set_xy(x_position, current_y + 10)
+            pdf.cell(col_width, 5, "Signature", 0, 0, 'C')
+    
+    pdf.ln(30)
+    
+    # Labels under signatures
+    pdf.set_font("Arial", size=9)
+    for i, (title, label, signature) in enumerate(signatures):
+        x_position = start_x + (i * (col_width + spacing))
+        pdf.set_xy(x_position, pdf.get_y())
+        pdf.cell(col_width, 5, label, 0, 0, 'C')
+    
+    return pdf
+
+
+class PDFCache:
+    """LRU cache of finished PDF bytes bounded by a total byte budget."""
+
+    def __init__(self, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            document = self._entries.get(key)
+            if document is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return document
+
+    def put(self, key, document):
+        if len(document) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = document
+            self._bytes += len(document)
+            while self._bytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+pdf_cache = PDFCache()
+tracer.add_collector('pdf_cache', pdf_cache.stats)
+
+
+def gate_pass_hash(gate_pass_data):
+    payload = json.dumps(gate_pass_data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Finished PDF bytes for a gate pass; unchanged passes are served from pdf_cache
+def render_gate_pass_pdf(gate_pass_data, signature_store=None, gate_check=None):
+    gate_check = gate_check or GateCheck()
+    key = gate_pass_hash(dict(gate_pass_data, gate_check=gate_check.payload(gate_pass_data['reference'])))
+    document = pdf_cache.get(key)
+    if document is None:
+        pdf = create_gate_pass_pdf(gate_pass_data, signature_store, gate_check)
+        with tracer.span('pdf.output') as span:
+            document = pdf.output(dest='S').encode('latin-1')
+            span.add_bytes(len(document))
+        pdf_cache.put(key, document)
+    return document
@@ -0,0 +1,143 @@
+import json
+import re
+import sqlite3
+import threading
+
+# Item fields as entered in the items editor
+ITEM_FIELDS = ['Quantity', 'Description', 'Total Value', 'Invoice No']
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def invoice_key(invoice_no):
+    """Invoice number as indexed: upper-cased, without spaces or dashes."""
+    return re.sub(r'[\s-]', '', str(invoice_no)).upper()
+
+
+def description_tokens(text):
+    return _TOKEN.findall(str(text).lower())
+
+
+def parse_items(items_json):
+    """The item dicts of an ``Items_JSON`` cell; malformed cells count as no items."""
+    try:
+        items = json.loads(items_json) if items_json else []
+    except ValueError:
+        return []
+    return [item for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+
+class ItemIndex:
+    """Item rows of every gate pass, normalized out of ``Items_JSON``.
+
+    Items live in ``gate_pass_items`` keyed by (reference, position), with
+    an index on the normalized invoice number, and every description word
+    in ``item_tokens``. Invoice lookups are one index probe and item
+    search intersects token postings, so neither depends on how many
+    passes exist. ``replace`` runs inside the caller's transaction, which
+    keeps a pass and its items in step.
+    """
+
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS gate_pass_items (
+                    reference TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    quantity TEXT NOT NULL DEFAULT '',
+                    description TEXT NOT NULL DEFAULT '',
+                    total_value TEXT NOT NULL DEFAULT '',
+                    invoice_no TEXT NOT NULL DEFAULT '',
+                    invoice_key TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (reference, position)
+                )
+            """)
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_gate_pass_items_invoice ON gate_pass_items(invoice_key)"
+            )
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS item_tokens (
+                    token TEXT NOT NULL,
+                    reference TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (token, reference, position)
+                ) WITHOUT ROWID
+            """)
+            # Re-indexing a pass deletes its postings by reference
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_item_tokens_reference ON item_tokens(reference)")
+
+    @classmethod
+    def open(cls, path):
+        """An index in its own database file, for backends without a local store."""
+        db = sqlite3.connect(path, check_same_thread=False)
+        with db:
+            db.execute("PRAGMA journal_mode=WAL")
+        return cls(db, threading.Lock())
+
+    def replace(self, passes):
+        """Re-index the items of ``passes`` ([(reference, items)]); call with the lock held, in a transaction."""
+        references = [(reference,) for reference, items in passes]
+        self._db.executemany("DELETE FROM gate_pass_items WHERE reference = ?", references)
+        self._db.executemany("DELETE FROM item_tokens WHERE reference = ?", references)
+
+        item_rows, token_rows = [], []
+        for reference, items in passes:
+            for position, item in enumerate(items):
+                values = [str(item.get(field, '') or '').strip() for field in ITEM_FIELDS]
+                item_rows.append([reference, position] + values + [invoice_key(values[3])])
+                token_rows.extend((token, reference, position) for token in set(description_tokens(values[1])))
+        self._db.executemany(
+            "INSERT INTO gate_pass_items (reference, position, quantity, description, total_value, invoice_no, invoice_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", item_rows
+        )
+        self._db.executemany("INSERT OR IGNORE INTO item_tokens (token, reference, position) VALUES (?, ?, ?)", token_rows)
+
+    def update(self, passes):
+        with self._lock, self._db:
+            self.replace(passes)
+
+    def rebuild(self, passes):
+        """Replace the whole index with ``passes`` ([(reference, items_json)])."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM gate_pass_items")
+            self._db.execute("DELETE FROM item_tokens")
+            self.replace([(reference, parse_items(items_json)) for reference, items_json in passes])
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM gate_pass_items").fetchone()[0]
+
+    def _items(self, source, params, limit):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT reference, position, quantity, description, total_value, invoice_no "
+                f"FROM {source} ORDER BY reference DESC, position LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [
+            dict(zip(['reference', 'position'] + ITEM_FIELDS, row))
+            for row in rows
+        ]
+
+    def by_invoice(self, invoice_no, limit=100):
+        key = invoice_key(invoice_no)
+        if not key:
+            return []
+        return self._items("gate_pass_items WHERE invoice_key = ?", [key], limit)
+
+    def search(self, text, limit=100):
+        """Items whose description has every word of ``text``; the last word may be a prefix."""
+        tokens = description_tokens(text)
+        if not tokens:
+            return []
+        postings = ["SELECT reference, position FROM item_tokens WHERE token = ?"] * (len(tokens) - 1)
+        # Tokens are [a-z0-9] only, so every word starting with the prefix sorts below prefix + '~'
+        postings.append("SELECT reference, position FROM item_tokens WHERE token >= ? AND token < ?")
+        params = tokens[:-1] + [tokens[-1], tokens[-1] + '~']
+        # Drive the join from the intersected postings, never from a scan of every item
+        return self._items(
+            f"({' INTERSECT '.join(postings)}) AS hits CROSS JOIN gate_pass_items USING (reference, position)",
+            params, limit
+        )
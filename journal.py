@@ -0,0 +1,121 @@
+import datetime
+import json
+import os
+import threading
+
+
+class OfflineJournal:
+    """Append-only, fsync'd on-disk journal of gate passes written while storage is unreachable.
+
+    Every session of the process shares one journal. Each line is a JSON
+    record: ``save`` (a full gate pass), ``complete`` (sign-off fields) or
+    ``replayed`` (the pass up to ``version`` reached storage). An in-memory
+    index of the latest state of each pass is rebuilt from the file on
+    start-up. A torn final line from a crash is skipped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        reference = record['reference']
+        entry = self._index.get(reference)
+        if record['op'] == 'save':
+            version = entry['version'] + 1 if entry else 1
+            self._index[reference] = {'data': record['data'], 'version': version,
+                                      'replayed': entry['replayed'] if entry else 0}
+        elif record['op'] == 'complete' and entry is not None:
+            entry['data'].update(record['fields'])
+            entry['version'] += 1
+        elif record['op'] == 'replayed' and entry is not None:
+            entry['replayed'] = max(entry['replayed'], record['version'])
+
+    def _append(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._apply(record)
+
+    def save(self, data):
+        self._append({'op': 'save', 'reference': data['reference'], 'data': data})
+
+    def complete(self, reference, certified_sig, authorized_sig, received_sig, vehicle_no):
+        with self._lock:
+            known = reference in self._index
+        if not known:
+            return False
+        fields = {
+            'authorized_signature': authorized_sig,
+            'received_signature': received_sig,
+            'vehicle_number': vehicle_no,
+            'status': 'completed',
+            'completed_date': datetime.datetime.now().isoformat(),
+        }
+        if certified_sig:
+            fields['certified_signature'] = certified_sig
+        self._append({'op': 'complete', 'reference': reference, 'fields': fields})
+        return True
+
+    def get(self, reference, pending_only=False):
+        with self._lock:
+            entry = self._index.get(reference)
+            if entry is None or (pending_only and entry['replayed'] >= entry['version']):
+                return None
+            return dict(entry['data'])
+
+    def pending(self):
+        """``[(version, gate_pass)]`` for every pass not yet replayed to storage."""
+        with self._lock:
+            return [
+                (entry['version'], dict(entry['data']))
+                for entry in self._index.values() if entry['replayed'] < entry['version']
+            ]
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for entry in self._index.values() if entry['replayed'] < entry['version'])
+
+    def mark_replayed(self, replayed):
+        # replayed: [(reference, version)]; written as one fsync'd batch
+        with self._lock:
+            records = [{'op': 'replayed', 'reference': reference, 'version': version}
+                       for reference, version in replayed]
+            self._file.write(''.join(json.dumps(record) + '\n' for record in records))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            for record in records:
+                self._apply(record)
+
+    def compact(self):
+        """Rewrite the journal keeping only passes that still need replaying."""
+        with self._lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as compacted:
+                for reference, entry in self._index.items():
+                    if entry['replayed'] < entry['version']:
+                        compacted.write(json.dumps({'op': 'save', 'reference': reference, 'data': entry['data']}) + '\n')
+                compacted.flush()
+                os.fsync(compacted.fileno())
+            self._file.close()
+            os.replace(temp_path, self.path)
+            self._index = {
+                reference: {'data': entry['data'], 'version': 1, 'replayed': 0}
+                for reference, entry in self._index.items() if entry['replayed'] < entry['version']
+            }
+            self._file = open(self.path, 'a', encoding='utf-8')
@@ -0,0 +1,142 @@
+import datetime
+import re
+import secrets
+import threading
+import time
+
+# Crockford base32: no I, L, O or U, so references survive being read aloud and retyped
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {char: value for value, char in enumerate(ALPHABET)}
+_DECODE.update({'O': 0, 'I': 1, 'L': 1})
+
+PREFIX = "GP"
+
+# Milliseconds since this epoch, 8 base32 characters (40 bits, good until 2058)
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+TIME_CHARS = 8
+# Per-millisecond sequence, 2 base32 characters
+SEQUENCE_CHARS = 2
+SEQUENCE_LIMIT = 32 ** SEQUENCE_CHARS
+# Node id, 2 base32 characters drawn at random per generator, so replicas issuing in the
+# same millisecond don't collide
+NODE_CHARS = 2
+NODE_LIMIT = 32 ** NODE_CHARS
+
+REFERENCE_LENGTH = len(PREFIX) + TIME_CHARS + SEQUENCE_CHARS + NODE_CHARS + 1
+
+# Crockford's check symbols: the body's value modulo 37, with five extra symbols for 32-36.
+# 37 is a prime larger than any digit, so every single substituted character and every
+# swap of two adjacent characters changes the check.
+CHECK_SYMBOLS = ALPHABET + "*~$=U"
+
+# References issued before this generator: GP + 8 hex digits of an MD5
+LEGACY_REFERENCE = re.compile(r"^GP[0-9A-F]{8}$")
+
+
+def _encode(value, width):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def _checksum(body):
+    value = 0
+    for char in body:
+        value = value * 32 + _DECODE[char]
+    return CHECK_SYMBOLS[value % 37]
+
+
+class ReferenceGenerator:
+    """Unique, time-ordered gate pass references.
+
+    A reference is ``GP`` + 8 characters of milliseconds since 2024 + a
+    2-character per-millisecond sequence + a 2-character node id + a
+    Crockford mod-37 check symbol, all Crockford base32 (e.g.
+    ``GP2J2KSHT3007QS``). The (millisecond, sequence) pair only ever moves
+    forward under a lock, so references from concurrent sessions in this
+    process never repeat, even when the clock steps back or more than 1024
+    are requested in one millisecond. The node id is random per generator
+    unless given, which makes collisions between replicas unlikely; storage
+    still refuses to overwrite an existing pass with a new one. References
+    sort by issue time, and ``reference_datetime`` recovers when one was
+    issued.
+    """
+
+    def __init__(self, clock=time.time, node=None):
+        self._clock = clock
+        self._node = _encode(secrets.randbelow(NODE_LIMIT) if node is None else node % NODE_LIMIT, NODE_CHARS)
+        self._lock = threading.Lock()
+        self._last_millis = -1
+        self._sequence = 0
+
+    def _next(self):
+        millis = int(self._clock() * 1000) - int(EPOCH.timestamp() * 1000)
+        if millis > self._last_millis:
+            self._last_millis = millis
+            self._sequence = 0
+        else:
+            self._sequence += 1
+            if self._sequence == SEQUENCE_LIMIT:
+                # Borrow the next millisecond rather than wrap around
+                self._last_millis += 1
+                self._sequence = 0
+        return self._last_millis, self._sequence
+
+    def _reference(self, millis, sequence):
+        body = _encode(millis, TIME_CHARS) + _encode(sequence, SEQUENCE_CHARS) + self._node
+        return PREFIX + body + _checksum(body)
+
+    def generate(self):
+        with self._lock:
+            millis, sequence = self._next()
+        return self._reference(millis, sequence)
+
+    def generate_many(self, count):
+        with self._lock:
+            issued = [self._next() for _ in range(count)]
+        return [self._reference(millis, sequence) for millis, sequence in issued]
+
+
+_generator = ReferenceGenerator()
+
+
+# Function to generate reference number
+def generate_reference():
+    return _generator.generate()
+
+
+def generate_references(count):
+    return _generator.generate_many(count)
+
+
+def normalize_reference(reference):
+    """Uppercase and strip typed input, mapping the Crockford look-alikes O/I/L to 0/1/1."""
+    reference = reference.strip().upper().replace('-', '').replace(' ', '')
+    if LEGACY_REFERENCE.match(reference) or not reference.startswith(PREFIX):
+        return reference
+    body = reference[len(PREFIX):]
+    return PREFIX + ''.join(ALPHABET[_DECODE[char]] if char in _DECODE else char for char in body)
+
+
+def is_valid_reference(reference):
+    """True for well-formed references: legacy ``GP`` + 8 hex, or newer ones with a valid check character."""
+    if LEGACY_REFERENCE.match(reference):
+        return True
+    if len(reference) != REFERENCE_LENGTH or not reference.startswith(PREFIX):
+        return False
+    body, check = reference[len(PREFIX):-1], reference[-1]
+    if any(char not in ALPHABET for char in body):
+        return False
+    return _checksum(body) == check
+
+
+def reference_datetime(reference):
+    """When a new-style reference was issued (UTC), or None for legacy or malformed ones."""
+    if not is_valid_reference(reference) or LEGACY_REFERENCE.match(reference):
+        return None
+    millis = 0
+    for char in reference[len(PREFIX):len(PREFIX) + TIME_CHARS]:
+        millis = millis * 32 + _DECODE[char]
+    return EPOCH + datetime.timedelta(milliseconds=millis)
@@ -0,0 +1,143 @@
+import pandas as pd
+
+from item_index import parse_items
+from storage import HEADERS, REGISTER_COLUMNS
+
+# Rows shown per page of the dispatch register
+PAGE_SIZE = 50
+
+# Columns shown in the register table, in order
+DISPLAY_COLUMNS = [
+    "Reference", "Created", "Requested_By", "Send_To", "Dispatch_Type", "Vehicle_Number",
+    "Item_Count", "Total_Value", "Invoice_Nos", "Status", "Return_Date", "Completed_Date",
+]
+
+EXPORT_FORMATS = {
+    'csv': ("CSV", "text/csv"),
+    'parquet': ("Parquet", "application/vnd.apache.parquet"),
+}
+
+# Rows read from storage, filtered and written per step of a register export
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _total_value(items):
+    total = 0.0
+    for item in items:
+        try:
+            total += float(str(item.get('Total Value', '')).replace(',', ''))
+        except ValueError:
+            pass
+    return total
+
+
+def _normalized_vehicle(vehicles):
+    return vehicles.str.upper().str.replace(r'[\s-]', '', regex=True)
+
+
+def build_snapshot(rows, sort=True):
+    """DataFrame of the register from ``REGISTER_COLUMNS`` records, newest first.
+
+    ``Items_JSON`` is parsed here, once per snapshot, into the item count,
+    total value, invoice numbers and descriptions. Lower-cased and
+    normalized search columns are precomputed, so filtering is pure
+    vectorised pandas work. With ``sort=False`` rows keep their input
+    order and positions as the index.
+    """
+    frame = pd.DataFrame.from_records(rows, columns=REGISTER_COLUMNS).fillna('').astype(str)
+    items = frame.pop('Items_JSON').map(parse_items)
+
+    frame['Item_Count'] = items.map(len)
+    frame['Total_Value'] = items.map(_total_value)
+    frame['Invoice_Nos'] = items.map(
+        lambda entries: ", ".join(str(item.get('Invoice No', '')).strip() for item in entries
+                                  if str(item.get('Invoice No', '')).strip())
+    )
+    frame['Descriptions'] = items.map(
+        lambda entries: " | ".join(str(item.get('Description', '')).strip() for item in entries)
+    )
+    frame['Created'] = pd.to_datetime(frame['Created_Date'], format='ISO8601', errors='coerce')
+    frame['Status'] = frame['Status'].str.lower().replace('', 'pending')
+    frame['Dispatch_Type'] = frame['Dispatch_Type'].astype('category')
+    frame['_requester'] = frame['Requested_By'].str.lower()
+    frame['_vehicle'] = _normalized_vehicle(frame['Vehicle_Number'])
+
+    if not sort:
+        return frame
+    return frame.sort_values('Created', ascending=False, na_position='last', ignore_index=True)
+
+
+def filter_register(frame, start_date=None, end_date=None, dispatch_types=None, statuses=None,
+                    requester="", vehicle_number=""):
+    """Rows of a snapshot matching every given filter; empty filters match everything."""
+    mask = pd.Series(True, index=frame.index)
+    if start_date is not None:
+        mask &= frame['Created'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= frame['Created'] < pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    if dispatch_types:
+        mask &= frame['Dispatch_Type'].isin(dispatch_types)
+    if statuses:
+        mask &= frame['Status'].isin(statuses)
+    if requester.strip():
+        mask &= frame['_requester'].str.contains(requester.strip().lower(), regex=False)
+    if vehicle_number.strip():
+        vehicle = _normalized_vehicle(pd.Series([vehicle_number]))[0]
+        mask &= frame['_vehicle'].str.contains(vehicle, regex=False)
+    return frame[mask]
+
+
+def page_count(rows, page_size=PAGE_SIZE):
+    return max(1, -(-rows // page_size))
+
+
+def register_page(frame, page, page_size=PAGE_SIZE):
+    """The display columns of page ``page`` (1-based) of a filtered snapshot."""
+    start = (page - 1) * page_size
+    return frame.iloc[start:start + page_size][DISPLAY_COLUMNS]
+
+
+def export_register(store, output, export_format='csv', filters=None, include_signatures=False,
+                    chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    """Stream the passes matching the register ``filters`` into the file at ``output``.
+
+    Storage is read ``chunk_size`` rows at a time and each chunk is filtered
+    and written before the next is read, so memory stays bounded by the
+    chunk whatever the size of the register. Signature columns are only
+    read when ``include_signatures`` is set. ``progress(rows_written)`` is
+    called after every chunk. Returns the number of rows written.
+    """
+    filters = filters or {}
+    columns = HEADERS if include_signatures else REGISTER_COLUMNS
+    chunks = store.iter_rows(columns, chunk_size, filters.get('start_date'), filters.get('end_date'))
+
+    if export_format == 'csv':
+        sink = open(output, 'w', newline='', encoding='utf-8')
+        pd.DataFrame(columns=columns).to_csv(sink, index=False)
+
+        def write(frame):
+            frame.to_csv(sink, header=False, index=False)
+    elif export_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(column, pa.string()) for column in columns])
+        sink = pq.ParquetWriter(output, schema)
+
+        def write(frame):
+            sink.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+    written = 0
+    try:
+        for chunk in chunks:
+            frame = pd.DataFrame.from_records(chunk, columns=columns).fillna('').astype(str)
+            matches = filter_register(build_snapshot(chunk, sort=False), **filters)
+            write(frame.loc[matches.index])
+            written += len(matches)
+            if progress is not None:
+                progress(written)
+    finally:
+        sink.close()
+    return written
@@ -0,0 +1,215 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import tracer
+
+# Default Sheets API quota: 60 requests per minute per user (the service account)
+DEFAULT_REQUESTS_PER_MINUTE = 60
+
+# HTTP statuses worth retrying: quota exhaustion and transient server errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Worksheet methods that only read; identical concurrent calls share one request
+READ_METHODS = {
+    'acell', 'batch_get', 'cell', 'col_values', 'get', 'get_all_records',
+    'get_all_values', 'get_values', 'row_values',
+}
+
+# Worksheet methods that add rows: after a 5xx or a dropped connection the rows may already
+# be in the sheet, so only a 429 (rejected before anything was written) is retried
+APPEND_METHODS = {'append_row', 'append_rows'}
+
+
+class SheetsQuotaExceeded(Exception):
+    """The Sheets quota was still exhausted after every retry."""
+
+
+class TokenBucket:
+    """Token-bucket limiter; callers reserve a token and sleep until it is theirs."""
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=10):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping if needed; returns the seconds spent waiting."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self):
+        """Take one token if one is free right now; never sleeps."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _error_status(error):
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+class SheetsAPI:
+    """Every gspread request goes through ``call``.
+
+    Requests are spaced by a token bucket sized to the project quota. Quota
+    (HTTP 429), transient 5xx and network errors are retried with full-jitter
+    exponential backoff; calls made with ``idempotent=False`` are only retried
+    after a 429. Identical reads issued concurrently from many sessions
+    collapse into one request. Inside ``fail_fast()`` a call neither waits
+    for a token nor retries.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=10,
+                 max_retries=5, backoff_base=1.0, backoff_cap=32.0):
+        self.limiter = TokenBucket(requests_per_minute, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._flights = {}
+        self._counters = {
+            'calls': 0, 'retries': 0, 'throttled': 0, 'quota_errors': 0,
+            'coalesced': 0, 'failures': 0,
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    # Calls made on this thread inside the block fail at once instead of waiting, for
+    # reads that are only worth making if they are quick
+    @contextmanager
+    def fail_fast(self):
+        previous = getattr(self._local, 'fail_fast', False)
+        self._local.fail_fast = True
+        try:
+            yield
+        finally:
+            self._local.fail_fast = previous
+
+    def failing_fast(self):
+        return getattr(self._local, 'fail_fast', False)
+
+    def call(self, fn, *args, coalesce_key=None, idempotent=True, **kwargs):
+        # A fail-fast call doesn't join a flight whose leader may be backing off
+        if coalesce_key is None or getattr(self._local, 'fail_fast', False):
+            return self._call_with_retry(fn, args, kwargs, idempotent)
+
+        with self._lock:
+            flight = self._flights.get(coalesce_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[coalesce_key] = _Flight()
+            else:
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._call_with_retry(fn, args, kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[coalesce_key]
+            flight.done.set()
+
+    def _call_with_retry(self, fn, args, kwargs, idempotent=True):
+        # Only needed once a request is made; importing them here keeps them out of cold start
+        import gspread
+        import requests
+
+        fail_fast = getattr(self._local, 'fail_fast', False)
+        attempt = 0
+        while True:
+            if fail_fast:
+                if not self.limiter.try_acquire():
+                    self._count('throttled')
+                    raise SheetsQuotaExceeded("Google Sheets is busy, please try again shortly")
+            elif self.limiter.acquire():
+                self._count('throttled')
+            self._count('calls')
+            tracer.count_api_call()
+            try:
+                return fn(*args, **kwargs)
+            except (gspread.exceptions.APIError, requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                status = _error_status(e)
+                if status == 429:
+                    self._count('quota_errors')
+                retryable = status in RETRYABLE_STATUSES or not isinstance(e, gspread.exceptions.APIError)
+                if not idempotent:
+                    retryable = status == 429
+                if not retryable or attempt >= self.max_retries or fail_fast:
+                    self._count('failures')
+                    if status == 429:
+                        raise SheetsQuotaExceeded("Google Sheets quota exceeded, please try again shortly") from e
+                    raise
+            delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+            time.sleep(random.uniform(0, delay))
+            attempt += 1
+            self._count('retries')
+
+
+class QuotaWorksheet:
+    """gspread Worksheet proxy that routes every method call through a SheetsAPI."""
+
+    def __init__(self, worksheet, api):
+        self._worksheet = worksheet
+        self._api = api
+
+    @property
+    def worksheet(self):
+        return self._worksheet
+
+    def __getattr__(self, name):
+        attribute = getattr(self._worksheet, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            coalesce_key = None
+            if name in READ_METHODS:
+                coalesce_key = (self._worksheet.id, name, repr(args), repr(sorted(kwargs.items())))
+            return self._api.call(attribute, *args, coalesce_key=coalesce_key,
+                                  idempotent=name not in APPEND_METHODS, **kwargs)
+
+        return call
@@ -0,0 +1,262 @@
+import base64
+import hashlib
+import io
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from tracing import tracer
+
+# Pixels darker than this (0-255, after compositing over white) count as ink
+INK_THRESHOLD = 160
+
+# White border kept around the ink bounding box, in pixels
+CROP_PADDING = 4
+
+_LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+
+# numpy and PIL load with the first signature, not with storage (which the ?ref= page also imports)
+def _composited_luma(image_data):
+    import numpy as np
+
+    pixels = np.asarray(image_data)
+    luma = pixels[..., :3].astype(np.float32) @ np.array(_LUMA_WEIGHTS, dtype=np.float32)
+    if pixels.shape[-1] == 4:
+        # Transparent canvas pixels are paper, whatever their RGB says
+        alpha = pixels[..., 3].astype(np.float32) / 255.0
+        luma = luma * alpha + 255.0 * (1.0 - alpha)
+    return luma
+
+
+def _ink_bounds(ink):
+    import numpy as np
+
+    rows = np.flatnonzero(ink.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(ink.any(axis=0))
+    height, width = ink.shape
+    return (
+        max(rows[0] - CROP_PADDING, 0), min(rows[-1] + CROP_PADDING + 1, height),
+        max(cols[0] - CROP_PADDING, 0), min(cols[-1] + CROP_PADDING + 1, width),
+    )
+
+
+@tracer.traced('signature.encode', payload=lambda png: len(png) if png else 0)
+def encode_signature_png(image_data, bits=1, threshold=INK_THRESHOLD):
+    """Compact PNG bytes for a canvas image, or None if nothing was drawn.
+
+    The image is cropped to the ink bounding box and reduced to ``bits`` bits
+    per pixel (1 = black/white, 2 or 4 = grey palette).
+    """
+    if image_data is None:
+        return None
+    import numpy as np
+    from PIL import Image
+
+    luma = _composited_luma(image_data)
+    ink = luma < threshold
+    bounds = _ink_bounds(ink)
+    if bounds is None:
+        return None
+    top, bottom, left, right = bounds
+    size = (right - left, bottom - top)
+
+    if bits == 1:
+        paper = ~ink[top:bottom, left:right]
+        image = Image.frombytes('1', size, np.packbits(paper, axis=1).tobytes())
+        options = {}
+    else:
+        levels = 2 ** bits
+        crop = luma[top:bottom, left:right]
+        shades = np.clip(crop * (levels / 256.0), 0, levels - 1).astype(np.uint8)
+        image = Image.frombytes('P', size, np.ascontiguousarray(shades).tobytes())
+        grey = [round(i * 255 / (levels - 1)) for i in range(levels)]
+        image.putpalette([value for shade in grey for value in (shade, shade, shade)])
+        options = {'bits': bits}
+
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG", optimize=True, **options)
+    return buffered.getvalue()
+
+
+# Function to turn st_canvas image data into the data URI stored with the gate pass
+def encode_signature(image_data, bits=1, threshold=INK_THRESHOLD):
+    png = encode_signature_png(image_data, bits=bits, threshold=threshold)
+    if png is None:
+        return None
+    return f"data:image/png;base64,{base64.b64encode(png).decode()}"
+
+
+# Prefix of the signature references stored in the sheet instead of inline image data
+SIGNATURE_REF_PREFIX = "sha256:"
+
+
+def is_signature_ref(value):
+    return isinstance(value, str) and value.startswith(SIGNATURE_REF_PREFIX)
+
+
+def decode_data_uri(value):
+    return base64.b64decode(value.split(',', 1)[1])
+
+
+class SignatureBlobStore:
+    """Content-addressed store for signature PNGs, keyed by SHA-256.
+
+    Gate pass rows keep only the ``sha256:<hex>`` reference once the image
+    is in ``remote``, a store every instance shares (the Signatures
+    worksheet, see ``storage.SheetsSignatureBlobs``); the SQLite file at
+    ``path`` caches it locally. Without a remote, or while it can't be
+    reached, ``put()`` returns an inline ``data:`` URI instead, so a row
+    never points at an image only this server holds. Images are loaded
+    lazily and kept in a small LRU cache. Rows written before the store
+    existed still carry inline ``data:`` URIs, which ``png()`` decodes as
+    before.
+    """
+
+    def __init__(self, path, cache_size=256, remote=None):
+        self.path = path
+        self.cache_size = cache_size
+        self.remote = remote
+        self._lock = threading.Lock()
+        self._db = None
+        self._cache = OrderedDict()
+        self._upload_started = False
+
+    def __getstate__(self):
+        # Only the path travels to worker processes; each opens its own connection and
+        # only sees the local file, so callers localize() the images workers will need
+        return {'path': self.path, 'cache_size': self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['cache_size'])
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            with self._db:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS signature_blobs "
+                    "(sha256 TEXT PRIMARY KEY, png BLOB NOT NULL, shared INTEGER NOT NULL DEFAULT 0)"
+                )
+                if 'shared' not in {row[1] for row in self._db.execute("PRAGMA table_info(signature_blobs)")}:
+                    # Files created before the shared store: every blob still has to be uploaded
+                    self._db.execute("ALTER TABLE signature_blobs ADD COLUMN shared INTEGER NOT NULL DEFAULT 0")
+        return self._db
+
+    def _remember(self, digest, png):
+        self._cache[digest] = png
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, digest, png, shared):
+        with self._lock:
+            db = self._connection()
+            with db:
+                db.execute(
+                    "INSERT INTO signature_blobs (sha256, png, shared) VALUES (?, ?, ?) "
+                    "ON CONFLICT(sha256) DO UPDATE SET shared = MAX(shared, excluded.shared)",
+                    (digest, png, int(shared))
+                )
+            self._remember(digest, png)
+
+    def put(self, png):
+        """Store PNG bytes and return their reference, or a data URI if the remote store didn't take them.
+
+        None passes through.
+        """
+        if png is None:
+            return None
+        digest = hashlib.sha256(png).hexdigest()
+        shared = False
+        if self.remote is not None:
+            try:
+                self.remote.put([(digest, png)])
+                shared = True
+            except Exception:
+                # Inline until the remote store is back; share_pending() uploads it later
+                pass
+        self._store(digest, png, shared)
+        if shared and not self._upload_started:
+            # The remote store is reachable: catch it up once per process, off the caller's thread
+            self._upload_started = True
+            threading.Thread(target=self._share_pending_quietly, name="signature-upload", daemon=True).start()
+        if not shared:
+            return f"data:image/png;base64,{base64.b64encode(png).decode()}"
+        return SIGNATURE_REF_PREFIX + digest
+
+    def get(self, digest):
+        with self._lock:
+            png = self._cache.get(digest)
+            if png is not None:
+                self._cache.move_to_end(digest)
+                return png
+            row = self._connection().execute(
+                "SELECT png FROM signature_blobs WHERE sha256 = ?", (digest,)
+            ).fetchone()
+            if row is not None:
+                png = bytes(row[0])
+                self._remember(digest, png)
+                return png
+        if self.remote is None:
+            return None
+        try:
+            png = self.remote.get(digest)
+        except Exception:
+            # Unreachable: shown as missing, and asked again next time
+            return None
+        if png is not None:
+            self._store(digest, png, shared=True)
+        return png
+
+    def localize(self, values):
+        """Copy the images of any references in ``values`` that only the remote store has into the local file."""
+        digests = {value[len(SIGNATURE_REF_PREFIX):] for value in values if is_signature_ref(value)}
+        if self.remote is None or not digests:
+            return
+        with self._lock:
+            local = {row[0] for row in self._connection().execute(
+                f"SELECT sha256 FROM signature_blobs WHERE sha256 IN ({', '.join('?' for _ in digests)})",
+                list(digests)
+            )}
+        for digest in digests - local:
+            self.get(digest)
+
+    def share_pending(self, batch_size=100):
+        """Upload the images the remote store hasn't taken yet; returns how many were uploaded."""
+        uploaded = 0
+        while self.remote is not None:
+            with self._lock:
+                rows = self._connection().execute(
+                    "SELECT sha256, png FROM signature_blobs WHERE shared = 0 LIMIT ?", (batch_size,)
+                ).fetchall()
+            if not rows:
+                break
+            self.remote.put([(digest, bytes(png)) for digest, png in rows])
+            with self._lock:
+                db = self._connection()
+                with db:
+                    db.executemany("UPDATE signature_blobs SET shared = 1 WHERE sha256 = ?",
+                                   [(digest,) for digest, png in rows])
+            uploaded += len(rows)
+        return uploaded
+
+    def _share_pending_quietly(self):
+        try:
+            self.share_pending()
+        except Exception:
+            # Still pending; the next process tries again
+            pass
+
+    def png(self, value):
+        """PNG bytes for a stored signature value (reference or data URI), or None."""
+        if not value or not isinstance(value, str) or not value.strip():
+            return None
+        if is_signature_ref(value):
+            return self.get(value[len(SIGNATURE_REF_PREFIX):])
+        if value.startswith('data:'):
+            return decode_data_uri(value)
+        return None
@@ -0,0 +1,1514 @@
+import base64
+import datetime
+import hmac
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import streamlit as st
+
+from gate_check import GateCheck
+from item_index import ItemIndex, description_tokens, invoice_key, parse_items
+from journal import OfflineJournal
+from references import generate_reference, reference_datetime
+from sheets_api import DEFAULT_REQUESTS_PER_MINUTE, QuotaWorksheet, SheetsAPI, SheetsQuotaExceeded
+from signatures import SignatureBlobStore
+from tracing import tracer
+
+SPREADSHEET_NAME = "Alumex_Gate_Passes"
+
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive'
+]
+
+HEADERS = [
+    "Reference", "Requested_By", "Send_To", "Purpose",
+    "Return_Date", "Dispatch_Type", "Vehicle_Number",
+    "Items_JSON", "Certified_Signature", "Authorized_Signature",
+    "Received_Signature", "Status", "Created_Date", "Completed_Date"
+]
+
+# Everything but the signature images, for the dispatch register
+REGISTER_COLUMNS = [header for header in HEADERS if not header.endswith('_Signature')]
+
+# Completed passes are moved out of the active worksheet into one worksheet per month
+ARCHIVE_PREFIX = "Archive_"
+
+# Signature images shared by every instance, one row per image (see SheetsSignatureBlobs)
+SIGNATURE_SHEET = "Signatures"
+SIGNATURE_HEADERS = ["SHA256", "PNG_Base64"]
+
+# Most characters Google Sheets accepts in one cell
+MAX_CELL_CHARS = 50000
+
+
+class StorageUnavailable(Exception):
+    """Storage couldn't answer right now (quota or outage); the pass may well exist."""
+
+
+class DuplicateReference(Exception):
+    """A new pass reused the reference of a stored one; nothing was written."""
+
+    def __init__(self, references):
+        super().__init__(f"Reference(s) already in use: {', '.join(references)}")
+        self.references = set(references)
+
+
+# Archive worksheet a pass belongs in: the month its reference was issued (UTC), or
+# for legacy references the month of its Created_Date. None when neither is known.
+def archive_title(reference, created_date=''):
+    issued = reference_datetime(reference)
+    month = issued.strftime('%Y-%m') if issued else str(created_date)[:7]
+    return ARCHIVE_PREFIX + month if month else None
+
+
+class ReferenceIndex:
+    """Reference -> sheet row number map, shared by every session.
+
+    It is rebuilt from column A only and kept current by ``add()`` whenever
+    this process appends a row. A miss triggers a rebuild (rows appended by
+    other processes), throttled to one per ``rebuild_interval`` seconds.
+    """
+
+    def __init__(self, rebuild_interval=5):
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._rows = None
+        self._last_rebuilt = 0.0
+
+    def rebuild(self, sheet):
+        references = sheet.col_values(1)
+        # Row 1 holds the headers
+        rows = {ref: i + 1 for i, ref in enumerate(references) if i > 0 and ref}
+        with self._lock:
+            self._rows = rows
+            self._last_rebuilt = time.monotonic()
+        return rows
+
+    def add(self, reference, row_num):
+        with self._lock:
+            if self._rows is not None:
+                self._rows[reference] = row_num
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+
+    def find(self, sheet, reference):
+        """Return ``(row_num, api_calls)``; ``row_num`` is None when the reference is unknown."""
+        with self._lock:
+            rows = self._rows
+            stale = time.monotonic() - self._last_rebuilt >= self.rebuild_interval
+        if rows is None or (reference not in rows and stale):
+            return self.rebuild(sheet).get(reference), 1
+        return rows.get(reference), 0
+
+
+class SheetsConnection:
+    """Lazily created gspread client and worksheet handle shared by every session.
+
+    The handle is health-checked at most once every ``health_check_interval``
+    seconds and rebuilt when the token has expired, the check fails, or a
+    caller reports a failed call through ``invalidate()``. Every request,
+    including the setup ones, goes through ``api``.
+
+    The first worksheet is the active partition; ``Archive_YYYY-MM``
+    worksheets hold completed passes moved there by a ``SheetsArchiver``.
+    Writers hold ``row_lock`` so the archiver never shifts rows under them.
+    The archive list is re-read at most every ``archive_refresh_interval``
+    seconds when asked to, to pick up archives other processes created.
+    The ``Signatures`` worksheet holds signature images (see
+    ``SheetsSignatureBlobs``).
+
+    After a failed connect, no new attempt is made for ``reconnect_interval``
+    seconds; callers get ``StorageUnavailable`` straight away instead. A
+    caller inside ``api.fail_fast()`` never waits for another thread's
+    connect either.
+
+    ``client`` replaces the authorized gspread client, e.g. with the
+    in-process fake used by the benchmarks.
+    """
+
+    def __init__(self, service_account_info, health_check_interval=300, api=None, client=None,
+                 archive_refresh_interval=60, reconnect_interval=30):
+        self.service_account_info = service_account_info
+        self.health_check_interval = health_check_interval
+        self.archive_refresh_interval = archive_refresh_interval
+        self.reconnect_interval = reconnect_interval
+        self.last_error = None
+        self.api = api or SheetsAPI()
+        self.client = client
+        self.created_sheet = False
+        self.reference_index = ReferenceIndex()
+        self.signature_index = ReferenceIndex()
+        self.row_lock = threading.RLock()
+        self._lock = threading.RLock()
+        self._creds = None
+        self._spreadsheet = None
+        self._worksheet = None
+        self._archives = {}
+        self._signatures = None
+        self._archive_indexes = {}
+        self._archives_listed = 0.0
+        self._last_checked = 0.0
+        self._last_failure = None
+
+    @tracer.traced('sheets.connect')
+    def _connect(self):
+        # gspread and google-auth load on the first connect, not with the app
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        if self.client is not None:
+            creds, client = None, self.client
+        else:
+            creds = Credentials.from_service_account_info(self.service_account_info, scopes=SCOPES)
+            client = gspread.authorize(creds)
+
+        try:
+            spreadsheet = self.api.call(client.open, SPREADSHEET_NAME)
+            # One metadata request yields the active sheet and every archive
+            worksheets = self.api.call(spreadsheet.worksheets)
+        except gspread.SpreadsheetNotFound:
+            # Create new sheet if it doesn't exist
+            spreadsheet = self.api.call(client.create, SPREADSHEET_NAME)
+            # Share the spreadsheet with the service account for full access
+            self.api.call(spreadsheet.share, self.service_account_info['client_email'], perm_type='user', role='writer')
+            worksheets = [self.api.call(lambda: spreadsheet.sheet1)]
+            self.api.call(worksheets[0].append_row, HEADERS)
+            self.created_sheet = True
+
+        self._creds = creds
+        self._spreadsheet = spreadsheet
+        self._worksheet = QuotaWorksheet(worksheets[0], self.api)
+        self._list_archives(worksheets)
+        self._last_checked = time.monotonic()
+
+    def _list_archives(self, worksheets):
+        self._archives = {
+            worksheet.title: QuotaWorksheet(worksheet, self.api)
+            for worksheet in worksheets[1:] if worksheet.title.startswith(ARCHIVE_PREFIX)
+        }
+        signatures = [worksheet for worksheet in worksheets[1:] if worksheet.title == SIGNATURE_SHEET]
+        self._signatures = QuotaWorksheet(signatures[0], self.api) if signatures else None
+        self._archives_listed = time.monotonic()
+
+    def _healthy(self):
+        if self._creds is not None and self._creds.expired:
+            return False
+        if time.monotonic() - self._last_checked < self.health_check_interval:
+            return True
+        try:
+            # Cheapest round trip that proves both the token and the sheet are usable
+            self._worksheet.row_values(1)
+        except SheetsQuotaExceeded:
+            # Busy, not broken: reconnecting would only spend more quota
+            return True
+        except Exception:
+            return False
+        self._last_checked = time.monotonic()
+        return True
+
+    def worksheet(self):
+        if not self._lock.acquire(blocking=not self.api.failing_fast()):
+            raise StorageUnavailable("Still connecting to Google Sheets")
+        try:
+            if self._worksheet is None or not self._healthy():
+                self._worksheet = None
+                if self._last_failure is not None and time.monotonic() - self._last_failure < self.reconnect_interval:
+                    raise StorageUnavailable(f"Google Sheets is unreachable ({self.last_error}); "
+                                             f"retrying within {self.reconnect_interval:.0f}s")
+                try:
+                    self._connect()
+                except SheetsQuotaExceeded:
+                    # Busy, not unreachable: the next caller may try again
+                    raise
+                except Exception as e:
+                    self._last_failure, self.last_error = time.monotonic(), e
+                    raise
+                self._last_failure = self.last_error = None
+            return self._worksheet
+        finally:
+            self._lock.release()
+
+    def archives(self, refresh=False):
+        """Archive worksheets by title; ``refresh`` re-reads the list unless it is recent."""
+        with self._lock:
+            self.worksheet()
+            if refresh and time.monotonic() - self._archives_listed >= self.archive_refresh_interval:
+                self._list_archives(self.api.call(self._spreadsheet.worksheets))
+            return dict(self._archives)
+
+    def archive_worksheet(self, title):
+        """The archive worksheet called ``title``, created with the headers if missing."""
+        with self._lock:
+            self.worksheet()
+            sheet = self._archives.get(title)
+            if sheet is None:
+                worksheet = self.api.call(self._spreadsheet.add_worksheet, title=title, rows=1, cols=len(HEADERS))
+                sheet = QuotaWorksheet(worksheet, self.api)
+                sheet.append_row(HEADERS)
+                self._archives[title] = sheet
+            return sheet
+
+    def signature_worksheet(self):
+        """The worksheet holding shared signature images, created with its headers if missing."""
+        self.worksheet()
+        with self._lock:
+            if self._signatures is None:
+                worksheet = self.api.call(self._spreadsheet.add_worksheet, title=SIGNATURE_SHEET, rows=1,
+                                          cols=len(SIGNATURE_HEADERS))
+                self._signatures = QuotaWorksheet(worksheet, self.api)
+                self._signatures.append_row(SIGNATURE_HEADERS)
+            return self._signatures
+
+    def archive_index(self, title):
+        with self._lock:
+            return self._archive_indexes.setdefault(title, ReferenceIndex())
+
+    def delete_rows(self, sheet, row_numbers):
+        # One batchUpdate; bottom-up so each deletion leaves the remaining row numbers valid
+        self.api.call(self._spreadsheet.batch_update, {'requests': [
+            {'deleteDimension': {'range': {
+                'sheetId': sheet.id, 'dimension': 'ROWS', 'startIndex': row_num - 1, 'endIndex': row_num
+            }}}
+            for row_num in sorted(row_numbers, reverse=True)
+        ]})
+
+    def invalidate(self):
+        with self._lock:
+            self._worksheet = None
+            self._creds = None
+            archive_indexes = list(self._archive_indexes.values())
+        self.reference_index.invalidate()
+        self.signature_index.invalidate()
+        for index in archive_indexes:
+            index.invalidate()
+
+
+@st.cache_resource(show_spinner=False)
+def get_sheets_connection():
+    # Check if secrets are available
+    if 'gcp_service_account' not in st.secrets:
+        return None
+    settings = _secrets_section('storage')
+    api = SheetsAPI(
+        requests_per_minute=int(settings.get('sheets_requests_per_minute', DEFAULT_REQUESTS_PER_MINUTE)),
+        burst=int(settings.get('sheets_burst', 10))
+    )
+    tracer.add_collector('sheets_api', api.stats)
+    return SheetsConnection(dict(st.secrets['gcp_service_account']), api=api)
+
+
+# Drop the pooled handle after a failed call, unless the failure was only the quota
+# or the connection already knows it is down
+def _handle_sheets_error(connection, error):
+    if connection is not None and not isinstance(error, (SheetsQuotaExceeded, StorageUnavailable)):
+        connection.invalidate()
+
+
+def _appended_row_number(response):
+    # append_row answers with the A1 range it wrote, e.g. "Sheet1!A42:N42"
+    try:
+        updated_range = response['updates']['updatedRange']
+    except (KeyError, TypeError):
+        return None
+    match = re.search(r'![A-Z]+(\d+)', updated_range)
+    return int(match.group(1)) if match else None
+
+
+# Append rows to the active sheet. Appends aren't retried after an ambiguous failure (see
+# sheets_api.APPEND_METHODS) because the rows may have landed anyway; dropping the index
+# makes the next write rebuild it from column A and overwrite them instead of appending twice.
+def _append_rows(connection, sheet, rows):
+    try:
+        return sheet.append_rows(rows)
+    except SheetsQuotaExceeded:
+        raise
+    except Exception:
+        connection.reference_index.invalidate()
+        raise
+
+
+# Worksheets that may hold a reference, in lookup order: the active sheet, then the
+# archive for the month the reference was issued (every archive, newest first, for
+# legacy references, whose month can't be told from the reference alone). On a miss
+# the archive list is re-read once, for archives another process created since.
+def _partitions(connection, reference):
+    yield connection.worksheet(), connection.reference_index
+    issued = archive_title(reference)
+    seen = set()
+    for refresh in (False, True):
+        archives = connection.archives(refresh=refresh)
+        for title in ([issued] if issued else sorted(archives, reverse=True)):
+            if title in archives and title not in seen:
+                seen.add(title)
+                yield archives[title], connection.archive_index(title)
+
+
+# Fetch a single row of one partition by reference through its index.
+# Returns (row_num, record, api_calls); row_num and record are None if it isn't there.
+def _find_in_partition(sheet, index, reference):
+    api_calls = 0
+    for _ in range(2):
+        row_num, calls = index.find(sheet, reference)
+        api_calls += calls
+        if row_num is None:
+            break
+        row = sheet.row_values(row_num)
+        api_calls += 1
+        if row and row[0] == reference:
+            # row_values drops trailing empty cells
+            row += [''] * (len(HEADERS) - len(row))
+            return row_num, dict(zip(HEADERS, row)), api_calls
+        # Rows were moved or deleted behind our back
+        index.invalidate()
+    return None, None, api_calls
+
+
+# Fetch a single row by reference from whichever partition holds it.
+# Returns (sheet, row_num, record, api_calls); all but api_calls are None if it isn't found.
+def _find_row(connection, reference):
+    api_calls = 0
+    for sheet, index in _partitions(connection, reference):
+        row_num, record, calls = _find_in_partition(sheet, index, reference)
+        api_calls += calls
+        if record is not None:
+            return sheet, row_num, record, api_calls
+    return None, None, None, api_calls
+
+
+# Column letter of a header, e.g. "Vehicle_Number" -> "G"
+def _column(name):
+    return chr(ord('A') + HEADERS.index(name))
+
+
+class SignatureUpdate:
+    """Outcome of ``update_signatures``; truthy when the pass was completed."""
+
+    def __init__(self, ok, api_calls=0, write_calls=0):
+        self.ok = ok
+        self.api_calls = api_calls
+        self.write_calls = write_calls
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f"SignatureUpdate(ok={self.ok}, api_calls={self.api_calls}, write_calls={self.write_calls})"
+
+
+def _record_to_gate_pass(record):
+    return {
+        'reference': record['Reference'],
+        'requested_by': record['Requested_By'],
+        'send_to': record['Send_To'],
+        'purpose': record['Purpose'],
+        'return_date': record['Return_Date'],
+        'dispatch_type': record['Dispatch_Type'],
+        'vehicle_number': record['Vehicle_Number'],
+        'items': json.loads(record['Items_JSON']),
+        'certified_signature': record['Certified_Signature'],
+        'authorized_signature': record['Authorized_Signature'],
+        'received_signature': record['Received_Signature'],
+        'status': record['Status'],
+        'created_date': record.get('Created_Date', ''),
+        'completed_date': record.get('Completed_Date', '')
+    }
+
+
+# Shared filter for listing passes: dates compare against the ISO Created_Date prefix
+def _matches_filters(record, start_date=None, end_date=None, dispatch_type=None):
+    created = str(record.get('Created_Date', ''))[:10]
+    if start_date is not None and created < start_date.isoformat():
+        return False
+    if end_date is not None and created > end_date.isoformat():
+        return False
+    if dispatch_type and record.get('Dispatch_Type') != dispatch_type:
+        return False
+    return True
+
+
+def _gate_pass_to_row(data):
+    return [
+        data['reference'], data['requested_by'], data['send_to'], data['purpose'],
+        data.get('return_date', ''), data['dispatch_type'], data.get('vehicle_number', ''),
+        json.dumps(data['items']), data.get('certified_signature', ''),
+        data.get('authorized_signature', ''), data.get('received_signature', ''),
+        data.get('status', 'pending'), data.get('created_date') or datetime.datetime.now().isoformat(),
+        data.get('completed_date', '')
+    ]
+
+
+# Write full rows to the sheet with one append_rows for rows no partition has yet
+# (they go to the active sheet) and one batch_update per partition for the rest. Rows
+# already present are found through the partition indexes and overwritten in place,
+# so replays are idempotent. rows: [values]; returns the sheet row number of each row.
+# An index can be stale (rows archived or deleted by another process), so column A of
+# every row about to be overwritten is checked first, one batch_get per partition.
+@tracer.traced('sheets.write')
+def _upsert_rows(connection, rows):
+    if tracer.enabled:
+        tracer.add_bytes(sum(len(str(value)) for values in rows for value in values))
+    with connection.row_lock:
+        sheet = connection.worksheet()
+        index = connection.reference_index
+        for attempt in range(2):
+            sheet_rows = [None] * len(rows)
+            changed = {}
+            for i, values in enumerate(rows):
+                for partition, partition_index in _partitions(connection, values[0]):
+                    sheet_row, api_calls = partition_index.find(partition, values[0])
+                    if sheet_row is not None:
+                        sheet_rows[i] = sheet_row
+                        changed.setdefault(partition.id, (partition, partition_index, []))[2].append(i)
+                        break
+
+            stale = False
+            for partition, partition_index, indices in changed.values():
+                cells = partition.batch_get([f"A{sheet_rows[i]}" for i in indices])
+                if any((cell[0][0] if cell and cell[0] else '') != rows[i][0] for i, cell in zip(indices, cells)):
+                    partition_index.invalidate()
+                    stale = True
+            if not stale:
+                break
+        else:
+            raise RuntimeError("Sheet rows moved while writing; the write will be retried")
+
+        new = [i for i, sheet_row in enumerate(sheet_rows) if sheet_row is None]
+        if new:
+            response = _append_rows(connection, sheet, [rows[i] for i in new])
+            first_row = _appended_row_number(response)
+            if first_row is None:
+                index.invalidate()
+            else:
+                for offset, i in enumerate(new):
+                    sheet_rows[i] = first_row + offset
+                    index.add(rows[i][0], sheet_rows[i])
+
+        last_column = _column(HEADERS[-1])
+        for partition, partition_index, indices in changed.values():
+            partition.batch_update([
+                {'range': f"A{sheet_rows[i]}:{last_column}{sheet_rows[i]}", 'values': [rows[i]]}
+                for i in indices
+            ])
+
+    return sheet_rows
+
+
+class StorageBackend:
+    """Interface behind save_gate_pass, get_gate_pass and update_signatures."""
+
+    name = "base"
+    replicator = None
+    archiver = None
+
+    def save(self, data):
+        raise NotImplementedError
+
+    def get(self, reference):
+        raise NotImplementedError
+
+    def complete(self, reference, certified_sig, authorized_sig, received_sig, vehicle_no):
+        raise NotImplementedError
+
+    def save_many(self, passes, new=False):
+        """Idempotently write complete gate passes (inserting or overwriting by reference).
+
+        With ``new``, the passes are all new and a reference that is already
+        stored raises ``DuplicateReference`` instead of being overwritten
+        (where the backend can tell without extra requests).
+        """
+        raise NotImplementedError
+
+    def register_rows(self):
+        """Every pass as a ``REGISTER_COLUMNS`` dict, without reading any signature data."""
+        raise NotImplementedError
+
+    def item_index(self):
+        """The ItemIndex covering every pass in this backend."""
+        raise NotImplementedError
+
+    def iter_rows(self, columns=HEADERS, chunk_size=1000, start_date=None, end_date=None):
+        """Yield passes created in the date range as lists of at most ``chunk_size`` ``columns`` dicts."""
+        raise NotImplementedError
+
+    def find_items(self, invoice_no="", text="", limit=100):
+        """Item rows (with their reference) carrying ``invoice_no``, or else matching ``text``."""
+        index = self.item_index()
+        return index.by_invoice(invoice_no, limit) if invoice_no.strip() else index.search(text, limit)
+
+    def status(self):
+        return ""
+
+
+class SheetsBackend(StorageBackend):
+    """Reads and writes go straight to the Google Sheet.
+
+    The item index is an in-memory SQLite database, built from the
+    Reference and Items_JSON columns the first time it is needed and kept
+    current by this process's saves. Passes written by other replicas or
+    edited in the sheet only reach it through a rebuild, so it is read
+    again once it is ``item_index_ttl`` seconds old.
+    """
+
+    name = "sheets"
+
+    def __init__(self, connection, item_index_ttl=60):
+        self.connection = connection
+        self.item_index_ttl = item_index_ttl
+        self._items = None
+        self._items_built = 0.0
+        self._items_lock = threading.Lock()
+
+    def save(self, data):
+        with self.connection.row_lock:
+            sheet = self.connection.worksheet()
+            response = _append_rows(self.connection, sheet, [_gate_pass_to_row(data)])
+            row_num = _appended_row_number(response)
+            if row_num is None:
+                self.connection.reference_index.invalidate()
+            else:
+                self.connection.reference_index.add(data['reference'], row_num)
+        if self._items is not None:
+            self._items.update([(data['reference'], data['items'])])
+
+    def get_record(self, reference):
+        sheet, row_num, record, api_calls = _find_row(self.connection, reference)
+        return row_num, record
+
+    def get(self, reference):
+        row_num, record = self.get_record(reference)
+        if record is None:
+            return None
+        return _record_to_gate_pass(record)
+
+    # Completing a pass is a single values.batchUpdate covering the vehicle number,
+    # the three signatures, the status and the completion timestamp.
+    def complete(self, reference, certified_sig, authorized_sig, received_sig, vehicle_no):
+        with self.connection.row_lock:
+            sheet, row_num, record, api_calls = _find_row(self.connection, reference)
+            if row_num is None:
+                return SignatureUpdate(False, api_calls)
+
+            certified_sig = certified_sig or record['Certified_Signature']
+            completed_date = datetime.datetime.now().isoformat()
+            sheet.batch_update([
+                {'range': f"{_column('Vehicle_Number')}{row_num}", 'values': [[vehicle_no]]},
+                {'range': f"{_column('Certified_Signature')}{row_num}:{_column('Status')}{row_num}",
+                 'values': [[certified_sig, authorized_sig, received_sig, 'completed']]},
+                {'range': f"{_column('Completed_Date')}{row_num}", 'values': [[completed_date]]},
+            ])
+        return SignatureUpdate(True, api_calls + 1, 1)
+
+    def save_many(self, passes, new=False):
+        _upsert_rows(self.connection, [_gate_pass_to_row(data) for data in passes])
+        if self._items is not None:
+            self._items.update([(data['reference'], data['items']) for data in passes])
+
+    # Rebuilt in place, in one transaction, so searches see the old index or the new one
+    def item_index(self):
+        with self._items_lock:
+            if self._items is None or time.monotonic() - self._items_built >= self.item_index_ttl:
+                ranges = ["A:A", f"{_column('Items_JSON')}:{_column('Items_JSON')}"]
+                sheets = [self.connection.worksheet()] + list(self.connection.archives(refresh=True).values())
+                passes = []
+                for sheet in sheets:
+                    references, items = sheet.batch_get(ranges)
+                    # Row 1 holds the headers
+                    passes.extend(
+                        (reference[0], items[i][0] if i < len(items) and items[i] else '')
+                        for i, reference in enumerate(references) if i > 0 and reference
+                    )
+                if self._items is None:
+                    self._items = ItemIndex.open(':memory:')
+                self._items.rebuild(passes)
+                self._items_built = time.monotonic()
+            return self._items
+
+    # The active sheet plus the archives whose month can overlap the date range. The bounds
+    # are widened by a day because archive months follow UTC and Created_Date is local time.
+    def _partitions_between(self, start_date=None, end_date=None):
+        sheets = [self.connection.worksheet()]
+        for title, archive in sorted(self.connection.archives(refresh=True).items()):
+            month = title[len(ARCHIVE_PREFIX):]
+            if start_date is not None and month < (start_date - datetime.timedelta(days=1)).strftime('%Y-%m'):
+                continue
+            if end_date is not None and month > (end_date + datetime.timedelta(days=1)).strftime('%Y-%m'):
+                continue
+            sheets.append(archive)
+        return sheets
+
+    # Each partition is read chunk_size rows at a time, one batch_get per chunk. Without
+    # signature columns the request skips them, so only the requested side of the
+    # sheet ever crosses the wire.
+    def iter_rows(self, columns=HEADERS, chunk_size=1000, start_date=None, end_date=None):
+        if any(column.endswith('_Signature') for column in columns):
+            segments = [HEADERS]
+        else:
+            segments = [HEADERS[:HEADERS.index('Certified_Signature')],
+                        HEADERS[HEADERS.index('Received_Signature') + 1:]]
+
+        for sheet in self._partitions_between(start_date, end_date):
+            # Row 1 holds the headers
+            first = 2
+            while True:
+                last = first + chunk_size - 1
+                parts = sheet.batch_get([
+                    f"{_column(segment[0])}{first}:{_column(segment[-1])}{last}" for segment in segments
+                ])
+                chunk = []
+                # Reference is never empty, so the first range has one entry per row
+                for i in range(len(parts[0])):
+                    record = {}
+                    for segment, part in zip(segments, parts):
+                        values = list(part[i]) if i < len(part) else []
+                        record.update(zip(segment, values + [''] * (len(segment) - len(values))))
+                    if record['Reference'] and _matches_filters(record, start_date, end_date):
+                        chunk.append({column: record[column] for column in columns})
+                if chunk:
+                    yield chunk
+                if len(parts[0]) < chunk_size:
+                    break
+                first = last + 1
+
+    # One batch_get per partition for the columns either side of the signatures
+    def register_rows(self):
+        left = HEADERS[:HEADERS.index('Certified_Signature')]
+        right = HEADERS[HEADERS.index('Received_Signature') + 1:]
+        ranges = [f"A:{_column(left[-1])}", f"{_column(right[0])}:{_column(right[-1])}"]
+
+        sheets = [self.connection.worksheet()] + list(self.connection.archives(refresh=True).values())
+        rows = []
+        for sheet in sheets:
+            left_values, right_values = sheet.batch_get(ranges)
+            # Row 1 holds the headers; values come back without trailing empty cells or rows
+            for i in range(1, len(left_values)):
+                values = list(left_values[i]) + [''] * (len(left) - len(left_values[i]))
+                tail = list(right_values[i]) if i < len(right_values) else []
+                values += tail + [''] * (len(right) - len(tail))
+                if values[0]:
+                    rows.append(dict(zip(left + right, values)))
+        return rows
+
+
+SQLITE_COLUMNS = [header.lower() for header in HEADERS]
+
+
+def _sqlite_record(row):
+    return {header: row[column] for header, column in zip(HEADERS, SQLITE_COLUMNS)}
+
+
+class SQLiteBackend(StorageBackend):
+    """Local SQLite database as the indexed source of truth.
+
+    Every write bumps the row's ``version``; rows whose ``synced_version`` lags
+    behind are picked up by a ``SheetsReplicator`` and mirrored to the sheet.
+    Passes that only exist in the sheet (created before the switch, or saved
+    by another instance) are read through ``fallback`` and cached locally as
+    already synced. A cached copy with no local edits is read again once it
+    is ``fallback_ttl`` seconds old, so changes made elsewhere reach it; if
+    the sheet can't be asked, the cached copy is returned. That read fails
+    fast (no token wait, no retries) and is skipped altogether while the
+    replicator is failing, so a Sheets outage never holds up a lookup.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, fallback=None, fallback_ttl=300):
+        self.path = path
+        self.fallback = fallback
+        self.fallback_ttl = fallback_ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            columns = ", ".join(f"{column} TEXT NOT NULL DEFAULT ''" for column in SQLITE_COLUMNS[1:])
+            self._db.execute(f"""
+                CREATE TABLE IF NOT EXISTS gate_passes (
+                    reference TEXT PRIMARY KEY,
+                    {columns},
+                    fetched_at REAL,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    synced_version INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            if 'fetched_at' not in {row[1] for row in self._db.execute("PRAGMA table_info(gate_passes)")}:
+                # Databases created before fetched_at: add it; their old sheet_row column goes unused
+                self._db.execute("ALTER TABLE gate_passes ADD COLUMN fetched_at REAL")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_gate_passes_unsynced "
+                "ON gate_passes(reference) WHERE synced_version < version"
+            )
+
+        self.items = ItemIndex(self._db, self._lock)
+        if not self.items.count():
+            # Databases created before the item index: backfill it once
+            with self._lock:
+                passes = self._db.execute("SELECT reference, items_json FROM gate_passes").fetchall()
+            if passes:
+                self.items.rebuild([tuple(row) for row in passes])
+
+    # new: a plain INSERT, so a reference collision raises instead of replacing a stored pass
+    def _insert(self, row, fetched_at=None, synced=False, new=False):
+        placeholders = ", ".join("?" for _ in SQLITE_COLUMNS)
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    f"INSERT {'' if new else 'OR REPLACE '}INTO gate_passes "
+                    f"({', '.join(SQLITE_COLUMNS)}, fetched_at, version, synced_version) "
+                    f"VALUES ({placeholders}, ?, 1, ?)",
+                    row + [fetched_at, 1 if synced else 0]
+                )
+                self.items.replace([(row[0], parse_items(row[HEADERS.index('Items_JSON')]))])
+        except sqlite3.IntegrityError:
+            # Only a clash on the reference is a duplicate; any other constraint is a real error
+            with self._lock:
+                taken = self._db.execute("SELECT 1 FROM gate_passes WHERE reference = ?", (row[0],)).fetchone()
+            if taken is None:
+                raise
+            raise DuplicateReference([row[0]])
+
+    def save(self, data):
+        self._insert(_gate_pass_to_row(data), new=True)
+
+    def save_many(self, passes, new=False):
+        placeholders = ", ".join("?" for _ in SQLITE_COLUMNS)
+        insert = f"INSERT INTO gate_passes ({', '.join(SQLITE_COLUMNS)}) VALUES ({placeholders})"
+        if not new:
+            updates = ", ".join(f"{column} = excluded.{column}" for column in SQLITE_COLUMNS[1:])
+            insert += f" ON CONFLICT(reference) DO UPDATE SET {updates}, version = version + 1"
+        try:
+            with self._lock, self._db:
+                self._db.executemany(insert, [_gate_pass_to_row(data) for data in passes])
+                self.items.replace([(data['reference'], data['items']) for data in passes])
+        except sqlite3.IntegrityError:
+            references = [data['reference'] for data in passes]
+            with self._lock:
+                taken = self._db.execute(
+                    f"SELECT reference FROM gate_passes WHERE reference IN ({', '.join('?' for _ in references)})",
+                    references
+                ).fetchall()
+            if not taken:
+                raise
+            raise DuplicateReference([row[0] for row in taken])
+
+    def get(self, reference):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM gate_passes WHERE reference = ?", (reference,)
+            ).fetchone()
+        if row is not None:
+            if (row['fetched_at'] is None or row['synced_version'] < row['version']
+                    or time.time() - row['fetched_at'] < self.fallback_ttl):
+                return _record_to_gate_pass(_sqlite_record(row))
+            # A stale copy read through from the sheet: refresh it, or serve it if the sheet can't be asked
+            try:
+                record = self._read_through(reference)
+            except StorageUnavailable:
+                record = None
+            if record is None:
+                return _record_to_gate_pass(_sqlite_record(row))
+            self._refresh([record[header] for header in HEADERS], row['version'])
+            return _record_to_gate_pass(record)
+
+        if self.fallback is None:
+            return None
+        record = self._read_through(reference)
+        if record is None:
+            return None
+        self._insert([record[header] for header in HEADERS], fetched_at=time.time(), synced=True)
+        return _record_to_gate_pass(record)
+
+    # Function to read one pass from the fallback sheet, failing fast
+    def _read_through(self, reference):
+        if self.replicator is not None and self.replicator.last_error is not None:
+            raise StorageUnavailable("Google Sheets is unreachable; only passes saved on this server can be looked up")
+        try:
+            with self.fallback.connection.api.fail_fast():
+                _, record = self.fallback.get_record(reference)
+        except SheetsQuotaExceeded as e:
+            raise StorageUnavailable(str(e)) from e
+        except Exception as e:
+            # Not local and the sheet can't be asked: unknown, not "not found"
+            _handle_sheets_error(self.fallback.connection, e)
+            raise StorageUnavailable("Google Sheets is unreachable, please try again shortly") from e
+        return record
+
+    # Only overwrites the cached copy if it wasn't edited here since it was read
+    def _refresh(self, row, version):
+        assignments = ", ".join(f"{column} = ?" for column in SQLITE_COLUMNS[1:])
+        with self._lock, self._db:
+            updated = self._db.execute(
+                f"UPDATE gate_passes SET {assignments}, fetched_at = ? "
+                f"WHERE reference = ? AND version = ? AND synced_version = version",
+                row[1:] + [time.time(), row[0], version]
+            ).rowcount
+            if updated:
+                self.items.replace([(row[0], parse_items(row[HEADERS.index('Items_JSON')]))])
+
+    def complete(self, reference, certified_sig, authorized_sig, received_sig, vehicle_no):
+        if self.get(reference) is None:
+            return SignatureUpdate(False)
+        completed_date = datetime.datetime.now().isoformat()
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                UPDATE gate_passes
+                SET vehicle_number = ?,
+                    certified_signature = CASE WHEN ? != '' THEN ? ELSE certified_signature END,
+                    authorized_signature = ?, received_signature = ?,
+                    status = 'completed', completed_date = ?, version = version + 1
+                WHERE reference = ?
+                """,
+                (vehicle_no, certified_sig or '', certified_sig or '', authorized_sig, received_sig,
+                 completed_date, reference)
+            )
+        return SignatureUpdate(True)
+
+    @staticmethod
+    def _created_between(start_date=None, end_date=None):
+        clauses, params = [], []
+        if start_date is not None:
+            clauses.append("created_date >= ?")
+            params.append(start_date.isoformat())
+        if end_date is not None:
+            # Created_Date is a full ISO timestamp, so compare against the following day
+            clauses.append("created_date < ?")
+            params.append((end_date + datetime.timedelta(days=1)).isoformat())
+        return clauses, params
+
+    def register_rows(self):
+        columns = ", ".join(header.lower() for header in REGISTER_COLUMNS)
+        with self._lock:
+            rows = self._db.execute(f"SELECT {columns} FROM gate_passes").fetchall()
+        return [dict(zip(REGISTER_COLUMNS, row)) for row in rows]
+
+    def item_index(self):
+        return self.items
+
+    # A separate connection reads one WAL snapshot without holding the writers' lock
+    def iter_rows(self, columns=HEADERS, chunk_size=1000, start_date=None, end_date=None):
+        clauses, params = self._created_between(start_date, end_date)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        selected = ", ".join(column.lower() for column in columns)
+        with closing(sqlite3.connect(self.path)) as db:
+            cursor = db.execute(f"SELECT {selected} FROM gate_passes {where} ORDER BY created_date", params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [dict(zip(columns, row)) for row in rows]
+
+    def pending_rows(self, limit):
+        with self._lock:
+            return self._db.execute(
+                "SELECT * FROM gate_passes WHERE synced_version < version ORDER BY rowid LIMIT ?", (limit,)
+            ).fetchall()
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM gate_passes WHERE synced_version < version"
+            ).fetchone()[0]
+
+    def mark_synced(self, synced):
+        # synced: [(reference, version)]; a row edited again meanwhile stays pending
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE gate_passes SET synced_version = MAX(synced_version, ?) WHERE reference = ?",
+                [(version, reference) for reference, version in synced]
+            )
+
+    def status(self):
+        # Without a replicator nothing is waiting: the rows are never synced
+        if self.replicator is None:
+            return ""
+        pending = self.pending_count()
+        return f"{pending} change(s) waiting to sync to Google Sheets" if pending else ""
+
+
+class SheetsReplicator:
+    """Background write-behind from a SQLiteBackend to the Google Sheet.
+
+    New passes are pushed with one ``append_rows`` call per batch and edited
+    passes with one ``batch_update`` call per batch. Failures leave rows
+    pending, so a Sheets outage only delays the mirror.
+    """
+
+    def __init__(self, store, connection, interval=10, batch_size=200):
+        self.store = store
+        self.connection = connection
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_error = None
+        self.last_synced = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sheets-replicator", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                while self.sync_once() == self.batch_size:
+                    pass
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                _handle_sheets_error(self.connection, e)
+
+    def sync_once(self):
+        rows = self.store.pending_rows(self.batch_size)
+        if not rows:
+            return 0
+
+        _upsert_rows(self.connection, [[row[column] for column in SQLITE_COLUMNS] for row in rows])
+        self.store.mark_synced([(row['reference'], row['version']) for row in rows])
+        self.last_synced = datetime.datetime.now()
+        return len(rows)
+
+
+# Sorted row numbers as [first, last] runs of consecutive rows
+def _row_blocks(row_numbers):
+    blocks = []
+    for row_num in sorted(row_numbers):
+        if blocks and blocks[-1][1] == row_num - 1:
+            blocks[-1][1] = row_num
+        else:
+            blocks.append([row_num, row_num])
+    return blocks
+
+
+class SheetsArchiver:
+    """Background mover of completed passes from the active worksheet into monthly archives.
+
+    Passes completed more than ``archive_after`` seconds ago are appended to
+    their ``Archive_YYYY-MM`` worksheet and then deleted from the active one
+    in a single request, so the active sheet holds only open work and index
+    rebuilds and scans of it stay proportional to that. Rows already in
+    their archive are not appended twice, so a run interrupted between the
+    two steps is simply finished by the next one.
+
+    Deletes are by row number, so only one process may archive: it runs
+    on the instance whose ``[storage]`` section sets ``archive = true``.
+    """
+
+    def __init__(self, connection, interval=3600, archive_after=86400, batch_size=500):
+        self.connection = connection
+        self.interval = interval
+        self.archive_after = archive_after
+        self.batch_size = batch_size
+        self.last_error = None
+        self.last_archived = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sheets-archiver", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                while self.archive_once() == self.batch_size:
+                    pass
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                _handle_sheets_error(self.connection, e)
+            time.sleep(self.interval)
+
+    def archive_once(self):
+        cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=self.archive_after)).isoformat()
+        connection = self.connection
+        with connection.row_lock:
+            sheet = connection.worksheet()
+            moving = {}
+            count = 0
+            # Row 1 holds the headers
+            for row_num, values in enumerate(sheet.get_all_values()[1:], 2):
+                values = values + [''] * (len(HEADERS) - len(values))
+                record = dict(zip(HEADERS, values))
+                if record['Status'] != 'completed' or not record['Completed_Date'] or record['Completed_Date'] > cutoff:
+                    continue
+                title = archive_title(record['Reference'], record['Created_Date'])
+                if title is None:
+                    continue
+                moving.setdefault(title, []).append((row_num, values))
+                count += 1
+                if count == self.batch_size:
+                    break
+            if not moving:
+                return 0
+
+            for title, rows in moving.items():
+                archive = connection.archive_worksheet(title)
+                index = connection.archive_index(title)
+                present = index.rebuild(archive)
+                new = [values for row_num, values in rows if values[0] not in present]
+                if new:
+                    archive.append_rows(new)
+                    index.invalidate()
+
+            # Column A is read again right before the delete: if a hand edit or another process
+            # shifted the rows since get_all_values, a block now holding other passes is left alone
+            expected = {row_num: values[0] for rows in moving.values() for row_num, values in rows}
+            blocks = _row_blocks(expected)
+            current = sheet.batch_get([f"A{first}:A{last}" for first, last in blocks])
+            deletable = []
+            for (first, last), values in zip(blocks, current):
+                found = [row[0] if row else '' for row in values]
+                found += [''] * (last - first + 1 - len(found))
+                if found == [expected[row_num] for row_num in range(first, last + 1)]:
+                    deletable.extend(range(first, last + 1))
+            if deletable:
+                connection.delete_rows(sheet, deletable)
+            connection.reference_index.invalidate()
+
+        self.last_archived = datetime.datetime.now()
+        return count
+
+
+# Function to read one secrets section as a dict; empty when it or secrets.toml is missing
+def _secrets_section(name):
+    try:
+        return dict(st.secrets.get(name, {}))
+    except Exception:
+        return {}
+
+
+def _data_path(filename):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+
+
+class SheetsSignatureBlobs:
+    """Signature PNGs in the spreadsheet's Signatures worksheet, the remote of a SignatureBlobStore.
+
+    Each row holds an image's SHA-256 and its base64 PNG, so a ``sha256:``
+    reference written by one instance resolves on every other. Requests
+    fail fast: a submit during an outage gets an error straight away and
+    the store keeps that signature inline instead.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put(self, blobs):
+        """Append the ``(digest, png)`` pairs the worksheet doesn't hold yet, in one request."""
+        rows = {digest: base64.b64encode(png).decode() for digest, png in blobs}
+        if any(len(encoded) > MAX_CELL_CHARS for encoded in rows.values()):
+            raise ValueError("Signature image is too large for a Google Sheets cell")
+        try:
+            with self.connection.api.fail_fast():
+                sheet = self.connection.signature_worksheet()
+                index = self.connection.signature_index
+                new = [digest for digest in rows if index.find(sheet, digest)[0] is None]
+                if not new:
+                    return
+                response = sheet.append_rows([[digest, rows[digest]] for digest in new],
+                                             value_input_option='RAW')
+        except Exception as e:
+            # An append that failed may have landed anyway; a duplicate row is harmless
+            self.connection.signature_index.invalidate()
+            _handle_sheets_error(self.connection, e)
+            raise
+        first_row = _appended_row_number(response)
+        if first_row is None:
+            index.invalidate()
+        else:
+            for offset, digest in enumerate(new):
+                index.add(digest, first_row + offset)
+
+    def get(self, digest):
+        """PNG bytes for ``digest``, or None if no instance stored it."""
+        try:
+            with self.connection.api.fail_fast():
+                sheet = self.connection.signature_worksheet()
+                index = self.connection.signature_index
+                # A row that no longer matches means the index is stale: rebuild it and look once more
+                for rebuild in (False, True):
+                    row_num = index.rebuild(sheet).get(digest) if rebuild else index.find(sheet, digest)[0]
+                    if row_num is None:
+                        return None
+                    values = sheet.batch_get([f"A{row_num}:B{row_num}"])[0]
+                    if values and len(values[0]) == 2 and values[0][0] == digest:
+                        return base64.b64decode(values[0][1])
+                return None
+        except Exception as e:
+            _handle_sheets_error(self.connection, e)
+            raise
+
+
+@st.cache_resource(show_spinner=False)
+def get_signature_store():
+    connection = get_sheets_connection()
+    return SignatureBlobStore(_secrets_section('storage').get('signature_store_path', _data_path('signatures.db')),
+                              remote=SheetsSignatureBlobs(connection) if connection is not None else None)
+
+
+@st.cache_resource(show_spinner=False)
+def get_offline_journal():
+    return OfflineJournal(_secrets_section('storage').get('journal_path', _data_path('offline_journal.jsonl')))
+
+
+# QR payload settings from the [gate_check] secrets section: base_url is the app's
+# public address and secret keys the verification code
+@st.cache_resource(show_spinner=False)
+def get_gate_check():
+    settings = _secrets_section('gate_check')
+    return GateCheck(settings.get('base_url', ''), settings.get('secret', ''))
+
+
+# Tracing from the [tracing] secrets section: off unless enabled = true; metrics_file,
+# when set, is rewritten in the Prometheus text format every export_interval seconds
+@st.cache_resource(show_spinner=False)
+def get_tracer():
+    settings = _secrets_section('tracing')
+    tracer.configure(
+        enabled=bool(settings.get('enabled', False)),
+        metrics_file=settings.get('metrics_file'),
+        export_interval=float(settings.get('export_interval', 15))
+    )
+    return tracer
+
+
+# Whether token is the [tracing] admin_token that unlocks the tracing panel
+def tracing_admin(token):
+    admin_token = str(_secrets_section('tracing').get('admin_token', ''))
+    return bool(admin_token) and hmac.compare_digest(str(token).encode('utf-8'), admin_token.encode('utf-8'))
+
+
+_replay_lock = threading.Lock()
+
+
+# Push journaled passes to storage in batches; safe to repeat because save_many upserts
+def replay_offline_journal(store, journal, batch_size=200):
+    if store is None or not _replay_lock.acquire(blocking=False):
+        return 0
+    try:
+        pending = journal.pending()
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            store.save_many([gate_pass for version, gate_pass in batch])
+            journal.mark_replayed([(gate_pass['reference'], version) for version, gate_pass in batch])
+        if store.replicator is not None:
+            store.replicator.notify()
+        journal.compact()
+        return len(pending)
+    finally:
+        _replay_lock.release()
+
+
+# Minimum seconds between background replay attempts, so an outage isn't hammered every rerun
+REPLAY_RETRY_INTERVAL = 30
+
+_last_replay_attempt = 0.0
+
+# Guards only _last_replay_attempt; _replay_lock is held for a whole replay and must never
+# be waited on from a script thread
+_replay_attempt_lock = threading.Lock()
+
+
+def start_journal_replay(store, journal):
+    global _last_replay_attempt
+    if store is None or not journal.pending_count() or _replay_lock.locked():
+        return
+    with _replay_attempt_lock:
+        if time.monotonic() - _last_replay_attempt < REPLAY_RETRY_INTERVAL:
+            return
+        _last_replay_attempt = time.monotonic()
+    threading.Thread(
+        target=_replay_in_background, args=(store, journal), name="journal-replay", daemon=True
+    ).start()
+
+
+def _replay_in_background(store, journal):
+    try:
+        replay_offline_journal(store, journal)
+    except Exception as e:
+        # Still offline; the journal keeps everything until the next attempt
+        if isinstance(store, SheetsBackend):
+            _handle_sheets_error(store.connection, e)
+
+
+@st.cache_resource(show_spinner=False)
+def get_storage_backend():
+    """Process-wide storage backend chosen by the ``[storage]`` secrets section.
+
+    ``backend = "sqlite"`` (the default) keeps passes in ``sqlite_path`` and
+    replicates them to the sheet in the background when credentials exist;
+    ``backend = "sheets"`` reads and writes the sheet directly. On the one
+    instance that sets ``archive = true``, completed passes are archived
+    out of the active sheet after ``archive_after_days``.
+    """
+    settings = _secrets_section('storage')
+    connection = get_sheets_connection()
+
+    if settings.get('backend', 'sqlite') == 'sheets':
+        store = (SheetsBackend(connection, item_index_ttl=float(settings.get('item_index_ttl', 60)))
+                 if connection is not None else None)
+    else:
+        sqlite_path = settings.get('sqlite_path', _data_path('gate_passes.db'))
+        store = SQLiteBackend(sqlite_path, fallback=SheetsBackend(connection) if connection is not None else None,
+                              fallback_ttl=float(settings.get('fallback_ttl', 300)))
+        if connection is not None:
+            store.replicator = SheetsReplicator(
+                store, connection,
+                interval=float(settings.get('sync_interval', 10)),
+                batch_size=int(settings.get('sync_batch_size', 200))
+            )
+            store.replicator.start()
+
+    # Opt-in: exactly one instance should archive
+    if store is not None and connection is not None and settings.get('archive', False):
+        store.archiver = SheetsArchiver(
+            connection,
+            interval=float(settings.get('archive_interval', 3600)),
+            archive_after=float(settings.get('archive_after_days', 1)) * 86400
+        )
+        store.archiver.start()
+    return store
+
+
+# Fresh references tried for a new pass before a clash is treated as an error
+REFERENCE_ATTEMPTS = 5
+
+
+# Save a new pass; if another replica already issued its reference, it takes a fresh one
+def _save_new(store, data):
+    for attempt in range(REFERENCE_ATTEMPTS - 1):
+        try:
+            return store.save(data)
+        except DuplicateReference:
+            data['reference'] = generate_reference()
+    return store.save(data)
+
+
+# Function to save gate pass
+# Anything storage can't take right now goes to the shared offline journal and is replayed later.
+@tracer.traced('storage.save_gate_pass')
+def save_gate_pass(store, data):
+    data.setdefault('status', 'pending')
+    data.setdefault('created_date', datetime.datetime.now().isoformat())
+    journal = get_offline_journal()
+    try:
+        if store is None:
+            journal.save(data)
+            return True
+
+        _save_new(store, data)
+        if store.replicator is not None:
+            store.replicator.notify()
+        start_journal_replay(store, journal)
+        return True
+
+    except (DuplicateReference, sqlite3.IntegrityError) as e:
+        # The pass itself can't be stored; replaying it from the journal would fail the same
+        # way, or overwrite the pass that owns the reference
+        st.error(f"Error saving: {e}")
+        return False
+
+    except Exception as e:
+        st.error(f"Error saving: {e}")
+        if isinstance(store, SheetsBackend):
+            _handle_sheets_error(store.connection, e)
+        # Fallback
+        journal.save(data)
+        st.warning("Saved to the offline journal; it will sync automatically once storage is reachable.")
+        return True
+
+
+# Function to save many new gate passes at once (bulk import), batch_size passes per write.
+# Batches storage can't take go to the offline journal like single saves do.
+@tracer.traced('storage.save_gate_passes')
+def save_gate_passes(store, passes, batch_size=500, progress=None):
+    created_date = datetime.datetime.now().isoformat()
+    journal = get_offline_journal()
+    journaled = 0
+    for start in range(0, len(passes), batch_size):
+        batch = passes[start:start + batch_size]
+        for data in batch:
+            data.setdefault('status', 'pending')
+            data.setdefault('created_date', created_date)
+        saved = False
+        if store is not None:
+            try:
+                for attempt in range(REFERENCE_ATTEMPTS):
+                    try:
+                        store.save_many(batch, new=True)
+                        saved = True
+                        break
+                    except DuplicateReference as e:
+                        if attempt == REFERENCE_ATTEMPTS - 1:
+                            raise
+                        for data in batch:
+                            if data['reference'] in e.references:
+                                data['reference'] = generate_reference()
+            except (DuplicateReference, sqlite3.IntegrityError):
+                # Bad data, not an outage: journaling it would only fail again on replay
+                raise
+            except Exception as e:
+                if isinstance(store, SheetsBackend):
+                    _handle_sheets_error(store.connection, e)
+        if not saved:
+            for data in batch:
+                journal.save(data)
+            journaled += len(batch)
+        if progress is not None:
+            progress(start + len(batch), len(passes))
+
+    if store is not None:
+        if store.replicator is not None:
+            store.replicator.notify()
+        start_journal_replay(store, journal)
+    return journaled
+
+
+# Function to get gate pass by reference
+@tracer.traced('storage.get_gate_pass')
+def get_gate_pass(store, reference):
+    journal = get_offline_journal()
+    # Passes written or signed while offline are newer than anything storage has
+    pending = journal.get(reference, pending_only=True)
+    if pending is not None:
+        return pending
+
+    try:
+        if store is not None:
+            gate_pass = store.get(reference)
+            if gate_pass is not None:
+                return gate_pass
+
+    except Exception as e:
+        if isinstance(store, SheetsBackend):
+            _handle_sheets_error(store.connection, e)
+        gate_pass = journal.get(reference)
+        if gate_pass is not None:
+            return gate_pass
+        # Don't let a throttled or failed lookup masquerade as "not found"
+        if isinstance(e, (SheetsQuotaExceeded, StorageUnavailable)):
+            raise StorageUnavailable(str(e)) from e
+        raise StorageUnavailable("Storage is unreachable right now, please try again shortly") from e
+
+    # Fallback to the offline journal
+    return journal.get(reference)
+
+
+# Function to update signatures
+# gate_pass, when given, lets an offline sign-off be journaled even if the pass itself came from storage.
+# Only a storage failure falls back to the journal; a clean "not found" from storage is final.
+@tracer.traced('storage.update_signatures')
+def update_signatures(store, reference, certified_sig, authorized_sig, received_sig, vehicle_no, gate_pass=None):
+    journal = get_offline_journal()
+    if journal.get(reference, pending_only=True) is None:
+        try:
+            if store is not None:
+                result = store.complete(reference, certified_sig, authorized_sig, received_sig, vehicle_no)
+                if result and store.replicator is not None:
+                    store.replicator.notify()
+                return result
+
+        except Exception as e:
+            st.error(f"Error updating: {e}")
+            if isinstance(store, SheetsBackend):
+                _handle_sheets_error(store.connection, e)
+
+    # Fallback to the offline journal
+    if journal.get(reference) is None and gate_pass is not None:
+        journal.save(dict(gate_pass))
+    if journal.complete(reference, certified_sig, authorized_sig, received_sig, vehicle_no):
+        return SignatureUpdate(True)
+    return SignatureUpdate(False)
+
+
+# Function to stream the passes of a bulk export, chunk_size rows per storage read, so
+# a month-end range never has to fit in memory. Without a store, the passes waiting in
+# the offline journal are all there is. Each chunk read gets its own span: a decorator
+# would only time creating the generator, and a span held across the yields would
+# charge the caller's rendering to storage.
+def iter_gate_passes(store, start_date=None, end_date=None, dispatch_type=None, chunk_size=200):
+    if store is None:
+        for version, gate_pass in get_offline_journal().pending():
+            if _matches_filters(dict(zip(HEADERS, _gate_pass_to_row(gate_pass))), start_date, end_date, dispatch_type):
+                yield gate_pass
+        return
+    try:
+        chunks = store.iter_rows(HEADERS, chunk_size, start_date, end_date)
+        while True:
+            with tracer.span('storage.iter_gate_passes'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            for record in chunk:
+                if not dispatch_type or record['Dispatch_Type'] == dispatch_type:
+                    yield _record_to_gate_pass(record)
+    except Exception as e:
+        if isinstance(store, SheetsBackend):
+            _handle_sheets_error(store.connection, e)
+        raise
+
+
+# Function to list every pass for the dispatch register, signature columns excluded.
+# Passes still waiting in the offline journal replace their stored versions.
+@tracer.traced('storage.list_register_rows')
+def list_register_rows(store):
+    rows = {}
+    try:
+        if store is not None:
+            rows = {row['Reference']: row for row in store.register_rows()}
+    except Exception as e:
+        st.error(f"Error loading the dispatch register: {e}")
+        if isinstance(store, SheetsBackend):
+            _handle_sheets_error(store.connection, e)
+
+    for version, gate_pass in get_offline_journal().pending():
+        row = dict(zip(HEADERS, _gate_pass_to_row(gate_pass)))
+        rows[gate_pass['reference']] = {header: row[header] for header in REGISTER_COLUMNS}
+    return list(rows.values())
+
+
+# Function to find the items of every pass by invoice number or description words
+@tracer.traced('storage.find_items')
+def find_items(store, invoice_no="", text="", limit=100):
+    results = []
+    try:
+        if store is not None:
+            results = store.find_items(invoice_no, text, limit)
+    except Exception as e:
+        st.error(f"Error searching items: {e}")
+        if isinstance(store, SheetsBackend):
+            _handle_sheets_error(store.connection, e)
+
+    # Passes still in the offline journal aren't indexed yet and replace their stored
+    # versions; there are only ever a few, so they are matched directly
+    pending = [gate_pass for version, gate_pass in get_offline_journal().pending()]
+    pending_references = {gate_pass['reference'] for gate_pass in pending}
+    results = [item for item in results if item['reference'] not in pending_references]
+    key, tokens = invoice_key(invoice_no), description_tokens(text)
+    for gate_pass in pending:
+        for position, item in enumerate(gate_pass['items']):
+            if key:
+                matched = invoice_key(item.get('Invoice No', '')) == key
+            else:
+                words = description_tokens(item.get('Description', ''))
+                matched = (bool(tokens) and all(token in words for token in tokens[:-1])
+                           and any(word.startswith(tokens[-1]) for word in words))
+            if matched:
+                results.append(dict(item, reference=gate_pass['reference'], position=position))
+    return results[:limit]
@@ -0,0 +1,235 @@
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+# Fields summed per span name, in process, session and rerun totals
+SPAN_FIELDS = ('count', 'seconds', 'bytes', 'api_calls', 'errors')
+
+
+def _empty_totals():
+    return dict.fromkeys(SPAN_FIELDS, 0)
+
+
+def _add(totals, name, seconds, size, api_calls, failed):
+    entry = totals.setdefault(name, _empty_totals())
+    entry['count'] += 1
+    entry['seconds'] += seconds
+    entry['bytes'] += size
+    entry['api_calls'] += api_calls
+    entry['errors'] += failed
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_bytes(self, size):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """One timed operation; API calls made while it is open are charged to it and its parents."""
+
+    __slots__ = ('tracer', 'name', 'bytes', 'api_calls', '_started')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.bytes = 0
+        self.api_calls = 0
+        self._started = 0.0
+
+    def __enter__(self):
+        self.tracer._stack().append(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self._started
+        self.tracer._stack().pop()
+        self.tracer._finish(self, seconds, exc_type is not None)
+        return False
+
+    def add_bytes(self, size):
+        self.bytes += size
+
+
+class RunTrace:
+    """Spans finished during one script run (a full rerun or a fragment rerun)."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.totals = {}
+
+    def add(self, name, seconds, size, api_calls, failed):
+        _add(self.totals, name, seconds, size, api_calls, failed)
+
+
+class SessionTrace:
+    """Per-session span totals; each run is folded in when the next one starts."""
+
+    def __init__(self):
+        self.runs = 0
+        self.current = None
+        self._folded = {}
+
+    def start_run(self, kind):
+        if self.current is not None:
+            for name, entry in self.current.totals.items():
+                folded = self._folded.setdefault(name, _empty_totals())
+                for field in SPAN_FIELDS:
+                    folded[field] += entry[field]
+        self.runs += 1
+        self.current = RunTrace(kind)
+        return self.current
+
+    def totals(self):
+        totals = {name: dict(entry) for name, entry in self._folded.items()}
+        if self.current is not None:
+            for name, entry in self.current.totals.items():
+                merged = totals.setdefault(name, _empty_totals())
+                for field in SPAN_FIELDS:
+                    merged[field] += entry[field]
+        return totals
+
+
+class Tracer:
+    """Lightweight spans around the app's slow paths: durations, payload bytes and Sheets calls.
+
+    Disabled, ``span`` hands back a shared no-op and ``traced`` functions
+    call straight through, so instrumentation costs one attribute check.
+    Enabled, every span is added to the process totals and to the
+    ``RunTrace`` bound to the current thread (the script run that opened
+    it), and ``metrics_file``, when set, is rewritten in the Prometheus
+    text format every ``export_interval`` seconds by a daemon thread.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics_file = None
+        self.export_interval = 15.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._collectors = {}
+        self._exporter = None
+
+    def configure(self, enabled=False, metrics_file=None, export_interval=15.0):
+        self.enabled = enabled
+        self.metrics_file = metrics_file
+        self.export_interval = export_interval
+        if enabled and metrics_file and self._exporter is None:
+            self._exporter = threading.Thread(target=self._export_forever, name="metrics-export", daemon=True)
+            self._exporter.start()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name):
+        return Span(self, name) if self.enabled else _NULL_SPAN
+
+    def traced(self, name, payload=None):
+        """Decorator running the function in a span; ``payload(result)`` gives its bytes."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(name) as span:
+                    result = fn(*args, **kwargs)
+                    if payload is not None:
+                        span.add_bytes(payload(result))
+                    return result
+            return wrapper
+        return decorate
+
+    # Charge one Sheets API request to every span open on this thread
+    def count_api_call(self):
+        if not self.enabled:
+            return
+        for span in getattr(self._local, 'stack', ()):
+            span.api_calls += 1
+
+    # Charge payload bytes to the innermost span open on this thread
+    def add_bytes(self, size):
+        stack = getattr(self._local, 'stack', None)
+        if self.enabled and stack:
+            stack[-1].bytes += size
+
+    def bind(self, run):
+        """Send spans finished on this thread to ``run`` (None to stop)."""
+        self._local.run = run
+
+    def _finish(self, span, seconds, failed):
+        with self._lock:
+            _add(self._totals, span.name, seconds, span.bytes, span.api_calls, failed)
+        run = getattr(self._local, 'run', None)
+        if run is not None:
+            run.add(span.name, seconds, span.bytes, span.api_calls, failed)
+
+    def totals(self):
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._totals.items()}
+
+    def add_collector(self, name, stats):
+        """Export the numeric values of ``stats()`` as ``gatepass_<name>_<key>`` gauges."""
+        with self._lock:
+            self._collectors[name] = stats
+
+    def collected(self):
+        with self._lock:
+            collectors = dict(self._collectors)
+        return {name: stats() for name, stats in collectors.items()}
+
+    def prometheus_text(self):
+        lines = []
+        totals = sorted(self.totals().items())
+        for field, kind, help_text in (
+            ('count', 'counter', "Operations traced"),
+            ('seconds', 'counter', "Seconds spent in traced operations, nested spans included"),
+            ('bytes', 'counter', "Payload bytes produced by traced operations"),
+            ('api_calls', 'counter', "Google Sheets requests made inside traced operations"),
+            ('errors', 'counter', "Traced operations that raised"),
+        ):
+            metric = f"gatepass_span_{field}_total"
+            lines += [f"# HELP {metric} {help_text}.", f"# TYPE {metric} {kind}"]
+            lines += [f'{metric}{{span="{name}"}} {entry[field]}' for name, entry in totals]
+
+        for name, stats in sorted(self.collected().items()):
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = re.sub(r'[^a-zA-Z0-9_]', '_', f"gatepass_{name}_{key}")
+                    lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        # Written beside the target and renamed over it, so scrapers never see half a file
+        temporary = f"{self.metrics_file}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as metrics:
+            metrics.write(self.prometheus_text())
+        os.replace(temporary, self.metrics_file)
+
+    def _export_forever(self):
+        while True:
+            time.sleep(self.export_interval)
+            if not (self.enabled and self.metrics_file):
+                continue
+            try:
+                self.write_metrics()
+            except OSError:
+                # Unwritable path or full disk: tracing must never take the app down
+                pass
+
+
+tracer = Tracer()
@@ -0,0 +1,25 @@
+import datetime
+
+DISPATCH_TYPES = ["Credit Sale", "Cash Sale", "Returnable", "Non Returnable"]
+
+# Item columns of the create form's items editor
+ITEM_COLUMNS = ['Quantity', 'Description', 'Total Value', 'Invoice No']
+
+
+def non_empty_items(items):
+    return [item for item in items if any(str(value).strip() for value in item.values())]
+
+
+# The create form's submit rules, shared with bulk import.
+# Returns the error messages for a gate pass, in the order the form reports them.
+def validate_gate_pass(data):
+    errors = []
+    if not data.get('requested_by') or not data.get('send_to') or not data.get('vehicle_number'):
+        errors.append("Please fill in all required fields including vehicle number")
+    if data.get('dispatch_type') not in DISPATCH_TYPES:
+        errors.append(f"Type of dispatch must be one of: {', '.join(DISPATCH_TYPES)}")
+    if data.get('return_date') and data['return_date'] < datetime.date.today().isoformat():
+        errors.append("Tentative returnable date can't be in the past")
+    if not non_empty_items(data.get('items', [])):
+        errors.append("Please add at least one item")
+    return errors